@@ -0,0 +1,149 @@
+__author__ = 'joelwhitney'
+'''
+Brute-force check of the tiering algorithms in ff-tiers.py
+
+Runs ckmeans_1d() and ckmeans_tables() against every split of small random rank lists into k runs and checks their
+sum of squares is the best there is, then checks the tiers of refit_tiers() and gmm_1d() are contiguous in rank order,
+refit_tiers() ends with every player at their nearest tier center and gmm_1d() gives k tiers. Ranks are rounded so
+ties come up. Every failed case is printed and the exit code is 1.
+
+Run from the src directory
+`python benchmarks/algorithms.py`
+`python benchmarks/algorithms.py -cases 2000 -players 10 -seed 3`
+'''
+import argparse
+import itertools
+import sys
+
+import numpy as np
+
+from htmlsheet import load_fftiers
+
+
+def sum_of_squares(values, labels):
+    """
+    :param values: array of the values
+    :param labels: array of the cluster of each value
+    :return: sse: float total sum of squares of the values around their cluster means
+    """
+    return sum(float(np.square(values[labels == label] - values[labels == label].mean()).sum())
+               for label in np.unique(labels))
+
+
+def best_sum_of_squares(values, k):
+    """
+    the best sum of squares of any split of the sorted values into k runs, found by trying every split
+    :param values: array of the values
+    :param k: integer number of runs
+    :return: sse: float smallest total sum of squares
+    """
+    x = np.sort(values)
+    best = np.inf
+    for cuts in itertools.combinations(range(1, len(x)), k - 1):
+        bounds = (0,) + cuts + (len(x),)
+        best = min(best, sum(float(np.square(x[lo:hi] - x[lo:hi].mean()).sum()) for lo, hi in zip(bounds, bounds[1:])))
+    return best
+
+
+def contiguous(values, labels):
+    """
+    checks the tiers are runs of the values, no value of a tier sits between two values of another tier
+    :param values: array of the values
+    :param labels: array of the tier of each value
+    :return: Boolean: True if every tier is a run
+    """
+    tiers = sorted(np.unique(labels), key=lambda label: values[labels == label].min())
+    return all(values[labels == lower].max() <= values[labels == upper].min() for lower, upper in zip(tiers, tiers[1:]))
+
+
+def random_ranks(rng, num_players):
+    """
+    :return: average_rank, standard_deviation: arrays of ranks rounded to a half so some tie, and their spread
+    """
+    average_rank = np.round(np.sort(rng.gamma(2.0, 8.0, num_players)) * 2) / 2 + 1
+    return average_rank, rng.uniform(0.5, 6.0, num_players)
+
+
+def check_ckmeans(fftiers, average_rank, k):
+    """
+    :return: failures: list of strings describing what ckmeans_1d() or ckmeans_tables() got wrong
+    """
+    failures = []
+    best = best_sum_of_squares(average_rank, k)
+    labels, centroids = fftiers.ckmeans_1d(average_rank, k)
+    if abs(sum_of_squares(average_rank, labels) - best) > 1e-9 * max(1.0, best):
+        failures.append("ckmeans_1d sse {} best {}".format(sum_of_squares(average_rank, labels), best))
+    if not contiguous(average_rank, labels):
+        failures.append("ckmeans_1d tiers not contiguous")
+    if np.any(np.diff(centroids[:, 0]) < 0):
+        failures.append("ckmeans_1d tiers not numbered from the lowest ranks up")
+    sse_by_k = fftiers.ckmeans_tables(average_rank, k)[3]
+    for m in range(1, k + 1):
+        best_m = best_sum_of_squares(average_rank, m)
+        if abs(sse_by_k[m - 1] - best_m) > 1e-9 * max(1.0, best_m):
+            failures.append("ckmeans_tables k={} sse {} best {}".format(m, sse_by_k[m - 1], best_m))
+    return failures
+
+
+def check_refit(fftiers, rng, average_rank, k):
+    """
+    :return: failures: list of strings describing what refit_tiers() got wrong after moving a few players
+    """
+    failures = []
+    labels, centroids = fftiers.ckmeans_1d(average_rank, k)
+    moved = rng.random(len(average_rank)) < 0.2
+    new_rank = average_rank.copy()
+    new_rank[moved] = np.round((new_rank[moved] + rng.normal(0, 4, moved.sum())) * 2) / 2
+    labels, centroids = fftiers.refit_tiers(new_rank, labels, centroids, moved)
+    centers = centroids[:, 0]
+    if not contiguous(new_rank, labels):
+        failures.append("refit_tiers tiers not contiguous")
+    nearest = np.abs(new_rank[:, np.newaxis] - centers).min(axis=1)
+    if np.any(np.abs(new_rank - centers[labels]) > nearest + 1e-9):
+        failures.append("refit_tiers left players away from their nearest center")
+    for label in np.unique(labels):
+        if abs(centers[label] - new_rank[labels == label].mean()) > 1e-9:
+            failures.append("refit_tiers center {} is not the mean of its players".format(label))
+    return failures
+
+
+def check_gmm(fftiers, average_rank, standard_deviation, k):
+    """
+    :return: failures: list of strings describing what gmm_1d() got wrong, cold and warm started
+    """
+    failures = []
+    labels, centroids, components = fftiers.gmm_1d(average_rank, standard_deviation, k)
+    warm_labels = fftiers.gmm_1d(average_rank, standard_deviation, k, init=components[:3])[0]
+    for start, start_labels in [('cold', labels), ('warm', warm_labels)]:
+        if len(np.unique(start_labels)) != k:
+            failures.append("gmm_1d {} gave {} tiers".format(start, len(np.unique(start_labels))))
+        if np.any(np.diff(start_labels[np.argsort(average_rank, kind='stable')]) < 0):
+            failures.append("gmm_1d {} tiers not contiguous in rank order".format(start))
+    return failures
+
+
+def main(args):
+    fftiers = load_fftiers()
+    rng = np.random.default_rng(args.seed)
+    failed = 0
+    for case in range(args.cases):
+        num_players = int(rng.integers(2, args.players + 1))
+        k = int(rng.integers(1, min(args.max_k, num_players) + 1))
+        average_rank, standard_deviation = random_ranks(rng, num_players)
+        failures = check_ckmeans(fftiers, average_rank, k) + check_refit(fftiers, rng, average_rank, k) + \
+            check_gmm(fftiers, average_rank, standard_deviation, k)
+        for failure in failures:
+            print("case {} ({} players, k={}): {}".format(case, num_players, k, failure))
+            print("    ranks {}".format(average_rank.tolist()))
+        failed += bool(failures)
+    print("{} of {} cases failed".format(failed, args.cases))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("ff-tiers.py tiering algorithm check")
+    parser.add_argument('-cases', dest='cases', help="The number of random rank lists to check", default=500, type=int)
+    parser.add_argument('-players', dest='players', help="The most players in a rank list", default=12, type=int)
+    parser.add_argument('-k', dest='max_k', help="The most tiers to split a rank list into", default=5, type=int)
+    parser.add_argument('-seed', dest='seed', help="The seed the rank lists are drawn from", default=0, type=int)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,169 @@
+__author__ = 'joelwhitney'
+'''
+Synthetic FantasyPros fixtures for the ff-tiers.py benchmarks
+
+Builds cheat sheet exports shaped like the real ones (an html page with the rankings in the first table, a heading row,
+a hidden spacer row and tier rows between the players) for any number of players, and serves them with a local stub of
+the FantasyPros login and export endpoints so the download stage can be timed offline.
+'''
+import hashlib
+import http.server
+import threading
+
+import numpy as np
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE', 'K', 'DST']
+# the overall charts split the first 200 players over three plots so the stub's consensus sheet never has fewer
+OVERALL_MIN_PLAYERS = 200
+TEAMS = ['ARI', 'ATL', 'BAL', 'BUF', 'CAR', 'CHI', 'CIN', 'CLE', 'DAL', 'DEN', 'DET', 'GB', 'HOU', 'IND', 'JAC', 'KC',
+         'LAC', 'LAR', 'MIA', 'MIN', 'NE', 'NO', 'NYG', 'NYJ', 'OAK', 'PHI', 'PIT', 'SEA', 'SF', 'TB', 'TEN', 'WAS']
+PAGE_START = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <title>Fantasy Football Draft Rankings, Consensus Draft Rankings, Cheat Sheets</title>
+    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+</head>
+<body>
+<table cellpadding="0" cellspacing="0" border="0" id="data" class="table table-bordered table-striped player-table">
+    <thead>
+        <tr>
+            {headings}
+        </tr>
+    </thead>
+    <tbody>
+        <tr class="static" style="display:none">{spacer}</tr>'''
+PAGE_END = '''
+    </tbody>
+</table>
+<table id="footer"><tr><td>Not part of the rankings</td></tr></table>
+</body>
+</html>
+'''
+TIER_ROW = '<tr class="tier-row static"><td>Tier {tier}</td><td class="tier-filler" colspan="{colspan}">&nbsp;</td>' \
+           '<td class="right"><a href="javascript:;">(EDIT)</a></td></tr>'
+PLAYER_CELL = '<td class="player-label"><a href="/nfl/players/player-{n}.php">Player {n}</a> ' \
+              '<small class="grey">{team}</small> <a href="#" class="fp-player-link" fp-player-name="Player {n}"></a></td>'
+NOTES_CELL = '<td class="view-options notes" style="display:none; text-align:left;"><div class="note-wrap">' \
+             'Notes on player {n}, the kind of blurb every expert leaves.</div></td>'
+
+
+def export_html(num_players, overall=True, seed=0):
+    """
+    builds a cheat sheet export
+    :param num_players: integer number of players in the rankings
+    :param overall: Boolean True for the overall sheet with its position column, False for a single position sheet
+    :param seed: integer seed for the generated ranks
+    :return: html: string of the export page
+    """
+    random_state = np.random.RandomState(seed)
+    average_ranks = np.round(np.sort(np.arange(1, num_players + 1) + random_state.normal(0, 1.5, num_players)), 1)
+    standard_deviations = np.round(random_state.uniform(0.3, 12, num_players), 1)
+    best = np.maximum(1, np.floor(average_ranks - standard_deviations)).astype(int)
+    worst = np.ceil(average_ranks + standard_deviations).astype(int)
+    adp = np.round(average_ranks + random_state.normal(0, 4, num_players), 1)
+    positions = random_state.choice(POSITIONS, num_players)
+    position_counts = dict((position, 0) for position in POSITIONS)
+    headings = ['Rank', 'Player <small>(Team)</small>'] + (['Pos'] if overall else []) + \
+               ['Bye', 'Best', 'Worst', 'Avg', 'Std Dev', 'ADP', 'vs. ADP', 'Notes']
+    parts = [PAGE_START.format(headings=''.join('<th>{}</th>'.format(heading) for heading in headings),
+                               spacer='<td>&nbsp</td>' * (len(headings) - 1))]
+    tier = 0
+    for n in range(num_players):
+        # a new tier every dozen or so players, the parser has to skip these rows
+        if n % 12 == 0:
+            tier += 1
+            parts.append(TIER_ROW.format(tier=tier, colspan=len(headings) - 3))
+        position_counts[positions[n]] += 1
+        vs_adp = int(round(adp[n])) - (n + 1)
+        cells = ['<td>{}</td>'.format(n + 1), PLAYER_CELL.format(n=n + 1, team=TEAMS[n % len(TEAMS)])]
+        if overall:
+            cells.append('<td>{}{}</td>'.format(positions[n], position_counts[positions[n]]))
+        cells.extend(['<td>{}</td>'.format(4 + n % 10)] +
+                     ['<td class="view-options ranks">{}</td>'.format(value) for value in
+                      [best[n], worst[n], average_ranks[n], standard_deviations[n], adp[n],
+                       '{:+.1f}'.format(vs_adp) if vs_adp else '0.0']] +
+                     [NOTES_CELL.format(n=n + 1)])
+        parts.append('<tr class="mpb-player-{}">{}\n</tr>\n'.format(n + 1, '\n'.join(cells)))
+    parts.append(PAGE_END)
+    return ''.join(parts)
+
+
+class StubFantasyPros(object):
+    """
+    local stand in for the FantasyPros login page and cheat sheet exports
+    every export page, e.g. /nfl/rankings/qb-cheatsheets.php, is served as a generated sheet of num_players players,
+    the consensus and flex sheets with the overall columns (and at least OVERALL_MIN_PLAYERS) and the rest as position
+    sheets. exports need the cookie the login sets, requests are counted by path and conditional requests get a 304
+    like the real site
+    """
+
+    def __init__(self, num_players):
+        self.num_players = num_players
+        self.exports = {}
+        self.hits = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *log_args):
+                pass
+
+            def do_GET(self):
+                stub.count(self.path)
+                if self.path.startswith('/accounts/login'):
+                    self.respond(200, b'<html><form><input type="hidden" name="csrfmiddlewaretoken" '
+                                      b'value="stub-token"/></form></html>')
+                    return
+                # like the real site an export without the login cookie is sent to the login page
+                if 'sessionid=stub' not in self.headers.get('Cookie', ''):
+                    self.respond(302, b'', {'Location': '/accounts/login/?next=' + self.path})
+                    return
+                body, etag = stub.export(self.path.split('?')[0].split('/')[-1])
+                if self.headers.get('If-None-Match') == etag:
+                    self.respond(304, b'')
+                    return
+                self.respond(200, body, {'ETag': etag})
+
+            def do_POST(self):
+                stub.count('POST ' + self.path)
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.respond(200, b'', {'Set-Cookie': 'sessionid=stub; Path=/'})
+
+            def respond(self, status, body, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def count(self, path):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+
+    def export(self, page):
+        """
+        :param page: string page name, e.g. consensus-cheatsheets.php
+        :return: body, etag: bytes of the export and its etag
+        """
+        with self.lock:
+            if page not in self.exports:
+                # the flex sheet mixes positions so it has the position column like the consensus sheet
+                overall = page.startswith('consensus') or page.startswith('flex')
+                num_players = max(self.num_players, OVERALL_MIN_PLAYERS) if overall else self.num_players
+                body = export_html(num_players, overall=overall,
+                                   seed=int(hashlib.md5(page.encode()).hexdigest()[:6], 16)).encode('utf-8')
+                self.exports[page] = (body, '"{}"'.format(hashlib.sha256(body).hexdigest()[:16]))
+            return self.exports[page]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,88 @@
+__author__ = 'joelwhitney'
+'''
+Draft sheet benchmark for ff-tiers.py
+
+Times ffb_draft_sheet() on generated player tables so changes to the html rendering can be compared. The sheet shows
+six columns of 35 players, bigger tables check the players past the last column cost nothing.
+
+Run from the src directory
+`python benchmarks/htmlsheet.py`
+`python benchmarks/htmlsheet.py -players 200 210 1000 -runs 50`
+'''
+import argparse
+import importlib.util
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(SRC_DIRECTORY, 'ff-tiers.py')
+
+
+def load_fftiers():
+    """
+    loads ff-tiers.py as a module, its name is not importable
+    :return: fftiers: the loaded module
+    """
+    spec = importlib.util.spec_from_file_location('fftiers', SCRIPT)
+    fftiers = importlib.util.module_from_spec(spec)
+    sys.modules['fftiers'] = fftiers
+    spec.loader.exec_module(fftiers)
+    return fftiers
+
+
+def synthetic_table(fftiers, num_players, seed=0):
+    """
+    builds a preseason-overall shaped player table
+    :param fftiers: the loaded ff-tiers.py module
+    :param num_players: integer number of players
+    :param seed: integer seed for the generated ranks
+    :return: player_table, ordered_labels: numpy structured array with the PLAYER_TABLE_DTYPE fields and list of tiers
+    """
+    random_state = np.random.RandomState(seed)
+    player_table = np.zeros(num_players, dtype=fftiers.PLAYER_TABLE_DTYPE)
+    player_table['rank'] = np.arange(1, num_players + 1)
+    player_table['name'] = ['Player {}'.format(n) for n in range(1, num_players + 1)]
+    positions = random_state.choice(['QB', 'RB', 'WR', 'TE', 'K', 'DST'], num_players)
+    player_table['position'] = ['{}{}'.format(position, n // 6 + 1) for n, position in enumerate(positions)]
+    player_table['average_rank'] = np.round(np.sort(np.arange(1, num_players + 1) + random_state.normal(0, 2, num_players)), 2)
+    player_table['standard_deviation'] = np.round(random_state.uniform(0.5, 10, num_players), 2)
+    vs_adp = random_state.randint(-20, 20, num_players).astype(float)
+    vs_adp[random_state.rand(num_players) < 0.1] = np.nan
+    player_table['vs_adp'] = vs_adp
+    ordered_labels = list(np.arange(num_players) // 8 + 1)
+    return player_table, ordered_labels
+
+
+def main(args):
+    fftiers = load_fftiers()
+    draft_directory = tempfile.mkdtemp()
+    try:
+        for template in ['_tophalf_draft_html.text', '_bottomhalf_draft_html.text']:
+            shutil.copy(os.path.join(SRC_DIRECTORY, 'ffbdraft', template), draft_directory)
+        sheet_args = argparse.Namespace(ffbdraft_directory=draft_directory + os.sep,
+                                        ffbdraft_templates=draft_directory + os.sep, run_id=None)
+        for num_players in args.players:
+            player_table, ordered_labels = synthetic_table(fftiers, num_players)
+            timings = []
+            for run in range(args.runs):
+                start = time.perf_counter()
+                fftiers.ffb_draft_sheet(sheet_args, player_table, ordered_labels)
+                timings.append(time.perf_counter() - start)
+            size = os.path.getsize(os.path.join(draft_directory, 'FantasyFootballDraftSheet.html'))
+            print("{:6d} players  {:7.2f} ms median  {:7.2f} ms min  {:6d} bytes".format(
+                num_players, statistics.median(timings) * 1000, min(timings) * 1000, size))
+    finally:
+        shutil.rmtree(draft_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("ff-tiers.py draft sheet benchmark")
+    parser.add_argument('-players', dest='players', help="The table sizes to time", nargs='*', type=int, default=[200, 210, 1000])
+    parser.add_argument('-runs', dest='runs', help="The number of runs per size, the median is reported", default=20, type=int)
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+__author__ = 'joelwhitney'
+'''
+Import-time benchmark for ff-tiers.py
+
+Runs each stage of the program in a fresh interpreter under python -X importtime and reports how long the imports
+took, so a change that pulls a heavy library back into startup shows up here.
+
+Run from the src directory
+`python benchmarks/importtime.py`
+`python benchmarks/importtime.py -runs 5 -json importtime.json`
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(SRC_DIRECTORY, 'ff-tiers.py')
+
+# every snippet loads ff-tiers.py as a module then runs the stage the way the program would
+LOAD_SCRIPT = '''
+import argparse, importlib.util, sys, tempfile
+spec = importlib.util.spec_from_file_location('fftiers', {script!r})
+fftiers = importlib.util.module_from_spec(spec)
+sys.modules['fftiers'] = fftiers
+spec.loader.exec_module(fftiers)
+'''
+STAGE_SNIPPETS = {
+    # the stage functions import their own dependencies, a closed local port makes the login fail straight away
+    'download': '''
+args = argparse.Namespace(username='u', password='p', token='t', download_data='True', data_directory=tempfile.mkdtemp(),
+                          login_url='http://127.0.0.1:9/accounts/login/', fantasypros_url='http://127.0.0.1:9',
+                          download_workers=1, http_cache='False', write_csv='False', position_urls={{}}, session_file='')
+list(fftiers.completed_downloads(args, fftiers.nfl_downloads(args, 1, ['qb'])))
+''',
+    'cluster': '''
+player_table = fftiers.table_from_csv('preseason-qb', 0, {data_directory!r})
+fftiers.fit_tiers(player_table['average_rank'], 8, 'kmeans')
+''',
+    'render': '''
+player_table = fftiers.table_from_csv('preseason-qb', 0, {data_directory!r})
+plots_directory = tempfile.mkdtemp()
+args = argparse.Namespace(plots_directory=plots_directory, extra_plots_directories=[], cluster_algorithm='ckmeans',
+                          cluster_seed=None, tier_cache_mb=0, warm_tiers='False')
+fftiers.cluster_and_plot([(player_table, 8)], 'week-0-preseason-qb-raw.png', 'benchmark', args,
+                         sinks=[fftiers.partial(fftiers.save_plot, plots_directory)])
+''',
+}
+
+
+def parse_importtime(stderr):
+    """
+    sums the -X importtime report
+    :param stderr: string stderr of a python -X importtime run
+    :returns: total_us, packages: integer microseconds spent importing and dictionary of top level package to its
+    cumulative microseconds
+    """
+    total_us = 0
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+        # top level imports are the ones without indentation
+        if not name[1:].startswith(' '):
+            package = name.strip().split('.')[0]
+            packages[package] = packages.get(package, 0) + int(cumulative_us)
+    return total_us, packages
+
+
+def run_stage(stage, data_directory):
+    """
+    runs one stage in a fresh interpreter under -X importtime
+    :param stage: string 'help' or a key of STAGE_SNIPPETS
+    :param data_directory: string directory with the sample preseason csv files
+    :returns: total_us, packages: see parse_importtime()
+    """
+    if stage == 'help':
+        command = [sys.executable, '-X', 'importtime', SCRIPT, '--help']
+    else:
+        snippet = LOAD_SCRIPT.format(script=SCRIPT) + STAGE_SNIPPETS[stage].format(data_directory=data_directory)
+        command = [sys.executable, '-X', 'importtime', '-c', snippet]
+    result = subprocess.run(command, cwd=SRC_DIRECTORY, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError("{} stage failed: {}".format(stage, ' | '.join(errors[-3:])))
+    return parse_importtime(result.stderr)
+
+
+def main(args):
+    report = {}
+    for stage in ['help', 'download', 'cluster', 'render']:
+        totals = []
+        for run in range(args.runs):
+            total_us, packages = run_stage(stage, args.data_directory)
+            totals.append(total_us)
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        report[stage] = {'median_ms': statistics.median(totals) / 1000.0,
+                         'heaviest': [{'package': package, 'ms': us / 1000.0} for package, us in heaviest]}
+        print("{:10s} {:8.1f} ms  {}".format(stage, report[stage]['median_ms'],
+                                             ', '.join('{} {:.0f}ms'.format(item['package'], item['ms'])
+                                                       for item in report[stage]['heaviest'])))
+    if args.json_file:
+        with open(args.json_file, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("ff-tiers.py import-time benchmark")
+    parser.add_argument('-runs', dest='runs', help="The number of runs per stage, the median is reported", default=3, type=int)
+    parser.add_argument('-top', dest='top', help="The number of heaviest packages to list per stage", default=4, type=int)
+    parser.add_argument('-dat', dest='data_directory', help="The directory with the sample preseason csv files",
+                        default=os.path.join(SRC_DIRECTORY, 'data', 'fftiers', '2017'))
+    parser.add_argument('-json', dest='json_file', help="Optional file to save the report to as json", default=None)
+    main(parser.parse_args())
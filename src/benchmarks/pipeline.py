@@ -0,0 +1,230 @@
+__author__ = 'joelwhitney'
+'''
+Pipeline benchmark for ff-tiers.py
+
+Times each stage of the program on generated FantasyPros exports of 24, 200, 1000 and 5000 players, then the whole
+preseason run end to end against a local stub of the FantasyPros site, so it runs offline. Save a baseline once and
+later runs flag every stage that got slower than the baseline by more than the tolerance.
+
+Run from the src directory
+`python benchmarks/pipeline.py -save`
+`python benchmarks/pipeline.py -players 24 200 -runs 5`
+'''
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from importtime import SRC_DIRECTORY
+from htmlsheet import load_fftiers
+from fixtures import StubFantasyPros, export_html
+
+BASELINE_FILE = os.path.join(SRC_DIRECTORY, 'benchmarks', 'pipeline-baseline.json')
+POSITION_LIST = ['qb', 'rb', 'wr', 'te', 'flex', 'k', 'dst']
+
+
+def make_args(root, url):
+    """
+    builds the command line parameters for a run in its own folders against the stub
+    :param root: string temp directory for the data, plots and sheets
+    :param url: string url of the stub site
+    :return: args: the parameters ff-tiers.py would have parsed
+    """
+    for directory in ['data', 'plots', os.path.join('ffbdraft', 'images'), os.path.join('ffbweekly', 'images')]:
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    for template in ['_tophalf_draft_html.text', '_bottomhalf_draft_html.text']:
+        shutil.copy(os.path.join(SRC_DIRECTORY, 'ffbdraft', template), os.path.join(root, 'ffbdraft'))
+    return argparse.Namespace(username='benchmark', password='benchmark', token='benchmark', download_data='True',
+                              data_directory=os.path.join(root, 'data', ''),
+                              plots_directory=os.path.join(root, 'plots', ''),
+                              ffbdraft_directory=os.path.join(root, 'ffbdraft', ''),
+                              ffbweekly_directory=os.path.join(root, 'ffbweekly', ''), extra_plots_directories=[],
+                              login_url=url + '/accounts/login/', fantasypros_url=url,
+                              session_file=os.path.join(root, 'session.json'), snapshots='True', write_csv='True',
+                              cluster_algorithm='kmeans', cluster_seed=0, gmm_iterations=100, warm_tiers='False',
+                              warm_max_moved=0.1, image_max_days=7, tier_cache_mb=0, tier_samples=1000, auto_k='False', min_k=2,
+                              max_k=20, min_gvf=0.99, render_workers=1, http_cache='False', download_workers=7,
+                              queue_size=4, incremental='False',
+                              profiles_file=None, batch='False', batch_weeks='0-17', seasons=[], daemon='False',
+                              poll_minutes=60, run_times=[],
+                              report_file=None, profiler='none', profile_file='ff-tiers-profile', run_id=None,
+                              position_urls={}, cluster_overrides={}, web_outputs='True',
+                              ffbdraft_templates=os.path.join(root, 'ffbdraft', ''),
+                              ffbweekly_templates=os.path.join(root, 'ffbweekly', ''))
+
+
+def time_stage(runs, function, *function_args):
+    """
+    :param runs: integer number of times to run function
+    :param function: function to time
+    :param function_args: arguments to call function with
+    :return: seconds: float median seconds of the runs
+    """
+    timings = []
+    for run in range(runs):
+        start = time.perf_counter()
+        function(*function_args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def parse_export(fftiers, xls_file_name):
+    """
+    the parse half of download_and_convert() without the download, see rows_from_html_events()
+    """
+    from lxml import etree
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    with open(xls_file_name, 'rb') as xls_file:
+        parser.feed(xls_file.read())
+    parser.close()
+    return fftiers.rows_from_html_events(parser.read_events())
+
+
+def end_to_end(fftiers, num_players):
+    """
+    runs a whole preseason run, download to draft sheet, against a fresh stub in a fresh folder
+    :return: seconds, stages: float seconds of the run and dictionary of stage to the seconds its spans add up to
+    """
+    root = tempfile.mkdtemp()
+    try:
+        with StubFantasyPros(num_players) as stub:
+            args = make_args(root, stub.url)
+            # a season start in the future puts the program in the preseason
+            preseason = datetime.date.today() + datetime.timedelta(days=30)
+            del fftiers.timing_spans[:]
+            start = time.perf_counter()
+            fftiers.clustering_program(args, preseason, POSITION_LIST)
+            seconds = time.perf_counter() - start
+        stages = {}
+        for span in fftiers.timing_spans:
+            stages[span['stage']] = stages.get(span['stage'], 0.0) + span['seconds']
+        del fftiers.timing_spans[:]
+        return seconds, stages
+    finally:
+        shutil.rmtree(root)
+
+
+def benchmark_size(fftiers, num_players, runs):
+    """
+    times every stage for one table size
+    :return: results: dictionary of stage to median seconds
+    """
+    results = {}
+    root = tempfile.mkdtemp()
+    try:
+        xls_file_name = os.path.join(root, 'week-0-preseason-overall-raw.xls')
+        with open(xls_file_name, 'w', encoding='utf-8') as xls_file:
+            xls_file.write(export_html(num_players, overall=True))
+        csv_file_name = xls_file_name[:-4] + '.csv'
+        try:
+            import bs4
+            results['convertTxtToCsv'] = time_stage(runs, fftiers.convertTxtToCsv, xls_file_name,
+                                                    os.path.join(root, 'legacy.csv'))
+        except ImportError:
+            pass
+        rows = parse_export(fftiers, xls_file_name)
+        results['parse'] = time_stage(runs, parse_export, fftiers, xls_file_name)
+        with open(csv_file_name, 'w', encoding='utf-8') as csv_file:
+            csv_file.write(''.join(','.join(row) + '\n' for row in rows))
+        results['table_from_csv'] = time_stage(runs, fftiers.table_from_csv, 'preseason-overall', 0, root)
+        player_table = fftiers.table_from_csv('preseason-overall', 0, root)
+        k_value = min(10, num_players)
+        results['cluster_kmeans'] = time_stage(runs, fftiers.fit_tiers, player_table['average_rank'], k_value, 'kmeans', 0)
+        results['cluster_ckmeans'] = time_stage(runs, fftiers.fit_tiers, player_table['average_rank'], k_value, 'ckmeans')
+        results['cluster_gmm'] = time_stage(runs, fftiers.fit_tiers, player_table['average_rank'], k_value, 'gmm', None,
+                                            player_table['standard_deviation'])
+        # clusters with the exact backend so the time is almost all drawing and png encoding
+        plot_args = argparse.Namespace(cluster_algorithm='ckmeans', cluster_seed=None, tier_cache_mb=0,
+                                       warm_tiers='False')
+        results['render'] = time_stage(runs, fftiers.cluster_and_plot, [(player_table, k_value)],
+                                       'week-0-preseason-overall-raw.png', 'benchmark', plot_args,
+                                       [lambda plot_filename, png_bytes: None])
+        labels, centroids = fftiers.fit_tiers(player_table['average_rank'], k_value, 'ckmeans')
+        # a refresh where a few players moved, re-tiered from the last fit
+        moved = np.zeros(len(player_table), dtype=bool)
+        moved[::max(1, len(player_table) // 3)] = True
+        results['cluster_warm'] = time_stage(runs, fftiers.refit_tiers, player_table['average_rank'] + moved * 2.5,
+                                             labels, centroids, moved)
+        results['tier_probabilities'] = time_stage(runs, fftiers.tier_probabilities, player_table['average_rank'],
+                                                   player_table['standard_deviation'], centroids, 1000, 10, 0)
+        labels = fftiers.reorder_labels([labels])
+        os.makedirs(os.path.join(root, 'ffbdraft'))
+        for template in ['_tophalf_draft_html.text', '_bottomhalf_draft_html.text']:
+            shutil.copy(os.path.join(SRC_DIRECTORY, 'ffbdraft', template), os.path.join(root, 'ffbdraft'))
+        sheet_args = argparse.Namespace(ffbdraft_directory=os.path.join(root, 'ffbdraft', ''),
+                                        ffbdraft_templates=os.path.join(root, 'ffbdraft', ''), run_id=None)
+        results['ffb_draft_sheet'] = time_stage(runs, fftiers.ffb_draft_sheet, sheet_args, player_table, labels)
+    finally:
+        shutil.rmtree(root)
+    timings = [end_to_end(fftiers, num_players) for run in range(runs)]
+    results['end_to_end'] = statistics.median(seconds for seconds, stages in timings)
+    for stage in timings[0][1]:
+        results['end_to_end.' + stage] = statistics.median(stages.get(stage, 0.0) for seconds, stages in timings)
+    return results
+
+
+def regressions(report, baseline, tolerance, floor):
+    """
+    :param report: dictionary of players to dictionary of stage to seconds from this run
+    :param baseline: dictionary in the same shape from an earlier run
+    :param tolerance: float fraction a stage may get slower before it is flagged
+    :param floor: float seconds a stage has to take before it is flagged, very short stages are mostly noise
+    :return: flagged: list of (players, stage, seconds, baseline seconds) tuples
+    """
+    flagged = []
+    for players, results in report.items():
+        for stage, seconds in results.items():
+            baseline_seconds = baseline.get(players, {}).get(stage)
+            if baseline_seconds is not None and seconds > floor and seconds > baseline_seconds * (1 + tolerance):
+                flagged.append((players, stage, seconds, baseline_seconds))
+    return flagged
+
+
+def main(args):
+    fftiers = load_fftiers()
+    # the imports are not what is being timed
+    fftiers.warm_up(argparse.Namespace(cluster_algorithm='kmeans'))
+    # convertTxtToCsv() leaves the bs4 parser unset, same as it always has
+    warnings.filterwarnings('ignore', message='No parser was explicitly specified')
+    report = {}
+    for num_players in args.players:
+        report[str(num_players)] = benchmark_size(fftiers, num_players, args.runs)
+        print("{} players".format(num_players))
+        for stage, seconds in report[str(num_players)].items():
+            print("    {:28s} {:10.2f} ms".format(stage, seconds * 1000))
+    if args.save:
+        with open(args.baseline_file, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print("Saved baseline to {}".format(args.baseline_file))
+        return 0
+    if not os.path.exists(args.baseline_file):
+        print("No baseline at {}, run with -save to make one".format(args.baseline_file))
+        return 0
+    with open(args.baseline_file, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    flagged = regressions(report, baseline, args.tolerance, args.floor)
+    for players, stage, seconds, baseline_seconds in flagged:
+        print("REGRESSION {} players {}: {:.2f} ms, baseline {:.2f} ms".format(players, stage, seconds * 1000,
+                                                                             baseline_seconds * 1000))
+    if not flagged:
+        print("No stage slower than the baseline by more than {:.0%}".format(args.tolerance))
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("ff-tiers.py pipeline benchmark")
+    parser.add_argument('-players', dest='players', help="The table sizes to time", nargs='*', type=int, default=[24, 200, 1000, 5000])
+    parser.add_argument('-runs', dest='runs', help="The number of runs per stage, the median is reported", default=3, type=int)
+    parser.add_argument('-baseline', dest='baseline_file', help="The baseline json to compare against", default=BASELINE_FILE)
+    parser.add_argument('-save', dest='save', help="Save this run as the baseline instead of comparing", action='store_true')
+    parser.add_argument('-tolerance', dest='tolerance', help="The fraction a stage may get slower before it is flagged", default=0.25, type=float)
+    parser.add_argument('-floor', dest='floor', help="The seconds a stage has to take before it can be flagged", default=0.005, type=float)
+    sys.exit(main(parser.parse_args()))
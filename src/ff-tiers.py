@@ -16,8 +16,6 @@ To Do's
 -Make this program work with NHL data for Fantasy Hockey
 '''
 import argparse
-import requests
-from lxml import html
 import traceback
 import os
 import logging
@@ -25,16 +23,57 @@ import logging.handlers
 import datetime
 import sys
 import csv
+import json
+import hashlib
+import re
+import shutil
 from collections import OrderedDict
-from threading import Timer
+from contextlib import contextmanager
+from functools import partial, lru_cache
+import io
+import queue
+from threading import Event, Lock, Thread, local
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import numpy as np
-from sklearn.cluster import KMeans
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import cm
-from matplotlib import style
-style.use("ggplot")
 import time
-from bs4 import BeautifulSoup
+# requests, lxml, bs4, sklearn and matplotlib are imported by the stage that needs them so --help and
+# download-only runs don't pay for the plotting imports
+
+# guards the http cache while the download pool updates it
+http_cache_lock = Lock()
+# guards logging a shared session in again while the download pool uses it
+session_login_lock = Lock()
+# timing spans recorded by this process, see stage_span()
+timing_spans = []
+# the spans of the plot timed_plot() is running on this thread, kept apart from the download and convert threads'
+plot_spans = local()
+# items, throughput and input queue depth of each pipeline stage in the last run, see pipeline_plot_jobs()
+queue_stats = OrderedDict()
+# pieces of the draft and weekly sheets put together by render_sheet()
+POSITION_IMAGES = {'QB': "images/quarterbackbt.png", 'RB': "images/runningbackbt.png", 'WR': "images/receiverbt.png",
+                   'TE': "images/tightendbt.png", 'DST': "images/defensebt.png", 'K': "images/kickerbt.png"}
+SHEET_COLUMN_START = '\t\t\t\t<div class="col-xs-12 col-lg-2 rowpadsmall"> \n\t\t\t\t\t <ul class="list1"> \n'
+SHEET_COLUMN_STOP = '\t\t\t\t\t </ul> \n\t\t\t </div> \n'
+DRAFT_PLAYER_HTML = '\t\t\t\t\t\t\t\t<li class="listitem1"><img src={image} height=20px><small class="grey"> ' \
+                    '(T{tier}{confidence}) {average_rank}&nbsp;</small><a style="cursor: pointer;"> {name}</a>' \
+                    '<small class="grey"> {position}-{position_rank} (vADP: {vs_adp})</small> <a href="#" class="" ' \
+                    'fp-player-name="{name}"></a></li>\n'
+WEEKLY_PLAYER_HTML = '\t\t\t\t\t\t\t\t<li class="listitem1"><img src={image} height=20px><small class="grey"> (T{tier}) ' \
+                     '{average_rank}&nbsp;</small><a style="cursor: pointer;"> {name}</a><small class="grey"> ' \
+                     '{position}-{position_rank}</small> <a href="#" class="" fp-player-name="{name}"></a></li>\n'
+# raw csv files the batch mode picks up, e.g. week-3-wr-raw.csv or week-0-preseason-qb-raw.csv
+RAW_CSV_PATTERN = re.compile(r'^week-(\d+)-(.+)-raw\.csv$')
+# smallest variance a gmm_1d() tier can shrink to, stops a tier of one player collapsing onto it
+GMM_MIN_VARIANCE = 1e-2
+# website charts published under a content-hash name, e.g. preseason-qb-raw-1.3f2a9c01b7de.png
+HASHED_IMAGE_PATTERN = re.compile(r'^.+\.[0-9a-f]{12}\.png$')
+# columns of the player table passed through the pipeline, slices of it are views so no player data is copied
+PLAYER_TABLE_DTYPE = np.dtype([('rank', np.int32),
+                               ('name', 'U64'),
+                               ('position', 'U20'),
+                               ('average_rank', np.float64),
+                               ('standard_deviation', np.float64),
+                               ('vs_adp', np.float64)])
 
 
 def initialize_logging(logFile):
@@ -76,29 +115,164 @@ def verify_file_path(filePath):
         return True
 
 
-def text_from_excel(full_file_name):
+@contextmanager
+def stage_span(stage, name=None):
     """
-    converts old xls to csv using this roundabout method
-    :param full_file_name: downloaded xls file name
+    times the block inside as one span of a stage for the run report
+    spans go to timing_spans, or to the plot's own list while timed_plot() runs on the thread
+    :param stage: string stage, one of download, parse, convert, cluster, stability, render, savefig, html or publish
+    :param name: optional string of what the span worked on, e.g. week-0-preseason-qb
     """
-    logger = logging.getLogger()
-    logger.debug("Opening xls and csv files for conversion...")
+    start = time.perf_counter()
     try:
-        if verify_file_path(full_file_name):
-            with open(full_file_name, 'r') as xlsfile, open(full_file_name[:-4] + '.txt', 'w', newline="\n", encoding="utf-8") as csv_file:
-                xls_reader = csv.reader(xlsfile, delimiter='\t')
-                csv_writer = csv.writer(csv_file)
-                # skip first five lines
-                for i in range(5):
-                    next(xls_reader, None)
-                # write subsequent rows to csv file
-                for row in xls_reader:
-                    csv_writer.writerow(row)
-                logger.debug("Conversion succeeded...")
+        yield
+    finally:
+        spans = getattr(plot_spans, 'spans', None)
+        (timing_spans if spans is None else spans).append(
+            {'stage': stage, 'name': name, 'seconds': time.perf_counter() - start})
+
+
+def write_output(file_name, data, run_id=None, mode=None):
+    """
+    writes a file so readers only ever see the old or the new contents, never half a file
+    without a run id the data goes to a temp file that is renamed over file_name straight away, with one it is staged
+    next to file_name until publish_outputs() puts every output of the run live together
+    :param file_name: string of the full file path and name of the output
+    :param data: bytes or string to write
+    :param run_id: optional string id of the run the output is staged for
+    :param mode: optional integer permissions the file is created with, e.g. 0o600 for owner only
+    """
+    if run_id is not None:
+        temp_file_name = '{}.{}.staged'.format(file_name, run_id)
+    else:
+        temp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    opener = None if mode is None else lambda path, flags: os.open(path, flags, mode)
+    with open(temp_file_name, 'wb' if isinstance(data, bytes) else 'w', opener=opener) as temp_file:
+        temp_file.write(data)
+    if run_id is None:
+        os.replace(temp_file_name, file_name)
+
+
+def staged_outputs(directory, run_id):
+    """
+    lists the outputs staged in a directory for a run
+    :param directory: string directory to look in
+    :param run_id: string id of the run
+    :return: staged: list of (staged file name, final file name) tuples
+    """
+    suffix = '.{}.staged'.format(run_id)
+    if not os.path.isdir(directory):
+        return []
+    return [(os.path.join(directory, file_name), os.path.join(directory, file_name[:-len(suffix)]))
+            for file_name in sorted(os.listdir(directory)) if file_name.endswith(suffix)]
+
+
+def publish_outputs(args):
+    """
+    puts every output staged by the run in args live
+    charts go first and pages last so a page never links a chart that is not there yet. website charts are also
+    published under a content-hash name, e.g. images/preseason-qb-raw-1.3f2a9c01b7de.png, that never changes once
+    written, and the pages are pointed at the current ones so the images can be cached for good
+    :param args: list of parameters can be used to get the output directories and the run id
+    """
+    logger = logging.getLogger()
+    run_id = args.run_id
+    for plots_directory in [args.plots_directory] + list(args.extra_plots_directories):
+        for staged_file_name, file_name in staged_outputs(plots_directory, run_id):
+            os.replace(staged_file_name, file_name)
+    for page_directory, page_name in [(args.ffbdraft_directory, "FantasyFootballDraftSheet.html"),
+                                      (args.ffbweekly_directory, "FantasyFootballWeeklySheet.html")]:
+        images_directory = os.path.join(page_directory, 'images')
+        assets_file_name = os.path.join(images_directory, 'assets.json')
+        assets = load_build_manifest(assets_file_name) if os.path.exists(assets_file_name) else {}
+        changed_images = False
+        for staged_file_name, file_name in staged_outputs(images_directory, run_id):
+            with open(staged_file_name, 'rb') as image_file:
+                content_hash = hashlib.sha256(image_file.read()).hexdigest()[:12]
+            root, extension = os.path.splitext(os.path.basename(file_name))
+            hashed_name = '{}.{}{}'.format(root, content_hash, extension)
+            # write once, a hashed name that already exists already has these bytes
+            if not os.path.exists(os.path.join(images_directory, hashed_name)):
+                shutil.copyfile(staged_file_name, os.path.join(images_directory, hashed_name + '.tmp'))
+                os.replace(os.path.join(images_directory, hashed_name + '.tmp'), os.path.join(images_directory, hashed_name))
+            os.replace(staged_file_name, file_name)
+            superseded_name = assets.get(os.path.basename(file_name))
+            if superseded_name not in (None, hashed_name) and \
+                    os.path.exists(os.path.join(images_directory, superseded_name)):
+                # the age of a superseded chart counts from when pages stopped linking it
+                os.utime(os.path.join(images_directory, superseded_name))
+            assets[os.path.basename(file_name)] = hashed_name
+            changed_images = True
+        if changed_images:
+            write_output(assets_file_name, json.dumps(assets, indent=2, sort_keys=True))
+            prune_hashed_images(images_directory, assets, args.image_max_days)
+        page_file_name = os.path.join(page_directory, page_name)
+        staged_pages = staged_outputs(page_directory, run_id)
+        if staged_pages:
+            with open(staged_pages[0][0], 'r') as page_file:
+                page = page_file.read()
+            os.remove(staged_pages[0][0])
+        elif changed_images and os.path.exists(page_file_name):
+            # the page itself did not change but the charts it links did
+            with open(page_file_name, 'r') as page_file:
+                page = page_file.read()
         else:
-            logger.info("XLS file not found for: {} Skipping file...".format(full_file_name))
-    except Exception as e:
-        logger.info("Conversion failed with: {}".format(e))
+            continue
+        write_output(page_file_name, hashed_image_links(page, assets))
+        logger.debug("Published {}".format(page_file_name))
+
+
+def prune_hashed_images(images_directory, assets, max_days):
+    """
+    removes the content-hash charts no page links any more once they are older than max_days, so caches and pages
+    still open from an earlier run have time to stop asking for them
+    :param images_directory: string directory of the website charts
+    :param assets: dictionary of plain image name to the content-hash image name pages link now
+    :param max_days: float days a superseded chart is kept for
+    """
+    logger = logging.getLogger()
+    linked = set(assets.values())
+    oldest = time.time() - max_days * 86400
+    for file_name in os.listdir(images_directory):
+        if file_name in linked or not HASHED_IMAGE_PATTERN.match(file_name):
+            continue
+        full_file_name = os.path.join(images_directory, file_name)
+        if os.path.getmtime(full_file_name) < oldest:
+            os.remove(full_file_name)
+            logger.debug("Pruned {}".format(full_file_name))
+
+
+def discard_outputs(args):
+    """
+    removes the outputs staged by a run that failed so nothing half finished goes live
+    :param args: list of parameters can be used to get the output directories and the run id
+    """
+    directories = [args.plots_directory, args.ffbdraft_directory, os.path.join(args.ffbdraft_directory, 'images'),
+                   args.ffbweekly_directory, os.path.join(args.ffbweekly_directory, 'images')]
+    for directory in directories + list(args.extra_plots_directories):
+        for staged_file_name, file_name in staged_outputs(directory, args.run_id):
+            os.remove(staged_file_name)
+
+
+def hashed_image_links(page, assets):
+    """
+    points a page's chart links at their content-hash names
+    :param page: string html of the page, links may be plain (images/qb-raw-1.png) or hashed by an earlier run
+    :param assets: dictionary of plain image name to content-hash image name
+    :return: page: string html with the links swapped
+    """
+    if not assets:
+        return page
+    stems = sorted((os.path.splitext(name)[0] for name in assets), key=len, reverse=True)
+    pattern = re.compile(r'images/(' + '|'.join(re.escape(stem) for stem in stems) + r')(?:\.[0-9a-f]{12})?\.png')
+    return pattern.sub(lambda match: 'images/' + assets[match.group(1) + '.png'], page)
+
+
+def new_run_id():
+    """
+    :return: run_id: string id for the outputs of one run, unique across processes
+    """
+    return '{}-{}'.format(os.getpid(), int(time.time() * 1000))
 
 
 def get_nfl_week(start_week_date):
@@ -119,46 +293,326 @@ def get_nfl_week(start_week_date):
         return week
 
 
-def perform_session_download(args, url, full_file_name):
+def create_session(args, pool_size=10):
+    """
+    creates a session for FantasyPros so the cookie jar and pooled connections can be shared by every export download
+    of the run. the session saved by an earlier run is reused if there is one, otherwise it logs in
+    :param args: list of parameters can be used to get the login credentials, url and session file
+    :param pool_size: integer max number of pooled connections per host (match this to the download workers)
+    :return: session_requests: logged in requests session
+    """
+    logger = logging.getLogger()
+    import requests
+    # start session with a connection pool big enough for the concurrent downloads
+    logger.debug("Starting download session...")
+    session_requests = requests.session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session_requests.mount('http://', adapter)
+    session_requests.mount('https://', adapter)
+    # counts the log ins so download workers that all hit an expired session only log in again once
+    session_requests.login_count = 0
+    cookies = load_session_cookies(args) if args.session_file else []
+    if cookies:
+        logger.debug("Reusing saved session...")
+        for cookie in cookies:
+            session_requests.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'],
+                                         path=cookie['path'], expires=cookie['expires'], secure=cookie['secure'])
+    else:
+        log_in(args, session_requests)
+    return session_requests
+
+
+def log_in(args, session_requests):
+    """
+    logs the session in to FantasyPros with a fresh token from the login page and saves its cookies for later runs
+    :param args: list of parameters can be used to get the login credentials, url and session file
+    :param session_requests: requests session from create_session()
+    """
+    logger = logging.getLogger()
+    from lxml import html
+    # get payload values from command line parameters
+    username, password, token = args.username, args.password, args.token
+    payload = {"username": username,
+               "password": password,
+               "csrfmiddlewaretoken": token}
+    login_url = args.login_url
+    session_requests.cookies.clear()
+    result = session_requests.get(login_url)
+    # refresh token on new request, the one from the command line is only used if the page has none
+    tree = html.fromstring(result.text)
+    logger.debug("Updating token...")
+    authenticity_tokens = list(set(tree.xpath("//input[@name='csrfmiddlewaretoken']/@value")))
+    if authenticity_tokens:
+        payload["csrfmiddlewaretoken"] = authenticity_tokens[0]
+    session_requests.post(login_url,
+                          data=payload,
+                          headers=dict(referer=login_url))
+    session_requests.login_count += 1
+    if args.session_file:
+        save_session_cookies(args, session_requests)
+
+
+def log_in_again(args, session_requests, login_count):
+    """
+    logs the session in again after a download found it expired, unless another download already did
+    :param args: list of parameters can be used to get the login credentials, url and session file
+    :param session_requests: requests session from create_session()
+    :param login_count: integer login count of the session when the download that found it expired was sent
+    """
+    logger = logging.getLogger()
+    with session_login_lock:
+        if session_requests.login_count == login_count:
+            logger.info("FantasyPros session expired, logging in again...")
+            log_in(args, session_requests)
+
+
+def login_required(args, response):
+    """
+    checks if a download was turned away because the session is not logged in
+    :param args: list of parameters can be used to get the login url
+    :param response: requests response of the download, redirects already followed
+    :return: Boolean: True if the server answered 403 or redirected to the login page
+    """
+    if response.status_code == 403:
+        return True
+    return bool(response.history) and response.url.split('?')[0] == args.login_url.split('?')[0]
+
+
+def load_session_cookies(args):
+    """
+    loads the cookies of the session saved by an earlier run
+    the saved session is only used for the same login url and username and expired cookies are dropped
+    :param args: list of parameters can be used to get the session file, login url and username
+    :return: cookies: list of cookie dictionaries with name, value, domain, path, expires and secure, empty when there
+    is no session to reuse
+    """
+    logger = logging.getLogger()
+    if not os.path.isfile(args.session_file):
+        return []
+    try:
+        with open(args.session_file, 'r') as session_file:
+            session = json.load(session_file)
+    except Exception as e:
+        logger.info("Loading saved session failed with: {}".format(e))
+        return []
+    if session.get('login_url') != args.login_url or session.get('username') != args.username:
+        return []
+    now = time.time()
+    return [cookie for cookie in session.get('cookies', []) if cookie['expires'] is None or cookie['expires'] > now]
+
+
+def save_session_cookies(args, session_requests):
+    """
+    saves the session's cookies so later runs can skip logging in, the file is only readable by its owner
+    :param args: list of parameters can be used to get the session file, login url and username
+    :param session_requests: logged in requests session
+    """
+    logger = logging.getLogger()
+    cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                'expires': cookie.expires, 'secure': cookie.secure} for cookie in session_requests.cookies]
+    session = OrderedDict([('login_url', args.login_url), ('username', args.username), ('cookies', cookies)])
+    try:
+        write_output(args.session_file, json.dumps(session, indent=2), mode=0o600)
+    except Exception as e:
+        logger.info("Saving session failed with: {}".format(e))
+
+
+def load_http_cache(cache_file_name):
+    """
+    loads the on-disk http cache of export validators
+    :param cache_file_name: string of the full file path and name of the cache json
+    :return: http_cache: dictionary of url to dictionary of etag, last_modified and sha256 of the last download
+    """
+    logger = logging.getLogger()
+    if not verify_file_path(cache_file_name):
+        return {}
+    try:
+        with open(cache_file_name, 'r') as cache_file:
+            return json.load(cache_file)
+    except Exception as e:
+        logger.info("Loading http cache failed with: {}".format(e))
+        return {}
+
+
+def save_http_cache(cache_file_name, http_cache):
+    """
+    saves the http cache of export validators to disk
+    :param cache_file_name: string of the full file path and name of the cache json
+    :param http_cache: dictionary of url to dictionary of etag, last_modified and sha256 of the last download
+    """
+    logger = logging.getLogger()
+    try:
+        write_output(cache_file_name, json.dumps(http_cache, indent=2, sort_keys=True))
+    except Exception as e:
+        logger.info("Saving http cache failed with: {}".format(e))
+
+
+def perform_session_download(args, url, full_file_name, session_requests=None, http_cache=None, on_block=None):
     """
-    creates a session that allows the user to log in to FantasyPros and use the tokens
+    downloads an export with a logged in FantasyPros session, logging in first if no session is passed
+    when a http cache is passed the request is conditional and unchanged exports are not rewritten
     :param args: list of parameters can be used to get data directories
     :param url: string of the export xls url
     :param full_file_name: string of the full file path and name of file to be saved
+    :param session_requests: optional logged in session from create_session() to reuse
+    :param http_cache: optional dictionary from load_http_cache() to check and update
+    :param on_block: optional function called with each block of the body as it arrives (e.g. a parser feed)
+    :return: status: string 'changed', 'unchanged' or 'failed'
     """
     logger = logging.getLogger()
     try:
-        # get payload values from command line parameters
-        username, password, token = args.username, args.password, args.token
-        payload = {"username": username,
-                   "password": password,
-                   "csrfmiddlewaretoken": token}
-        # start session
-        logger.debug("Starting download session...")
-        session_requests = requests.session()
-        login_url = "https://secure.fantasypros.com/accounts/login/?"
-        result = session_requests.get(login_url)
-        # refresh token on new request
-        tree = html.fromstring(result.text)
-        logger.debug("Updating token...")
-        authenticity_token = list(set(tree.xpath("//input[@name='csrfmiddlewaretoken']/@value")))[0]
-        payload["csrfmiddlewaretoken"] = authenticity_token
-        session_requests.post(login_url,
-                              data=payload,
-                              headers=dict(referer=login_url))
+        if session_requests is None:
+            session_requests = create_session(args)
+        # only trust the validators if the file they describe is still on disk
+        cached = http_cache.get(url, {}) if http_cache is not None else {}
+        headers = {}
+        if cached and verify_file_path(full_file_name):
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        else:
+            cached = {}
+        login_count = session_requests.login_count
+        response = session_requests.get(url, headers=headers, stream=True)
+        # a saved session can expire between runs, log in again only when the site says so
+        if login_required(args, response):
+            response.close()
+            log_in_again(args, session_requests, login_count)
+            response = session_requests.get(url, headers=headers, stream=True)
+        if response.status_code == 304:
+            logger.info("Export not modified: {}".format(url))
+            return 'unchanged'
+        if not response.ok:
+            logger.info("Writing to xls failed...")
+            return 'failed'
+        # hash and hand off the body block by block as it comes off the socket
+        hasher = hashlib.sha256()
+        blocks = []
+        for block in response.iter_content(16384):
+            hasher.update(block)
+            blocks.append(block)
+            if on_block is not None:
+                on_block(block)
+        content = b''.join(blocks)
+        content_hash = hasher.hexdigest()
+        if http_cache is not None:
+            with http_cache_lock:
+                http_cache[url] = {'etag': response.headers.get('ETag'),
+                                   'last_modified': response.headers.get('Last-Modified'),
+                                   'sha256': content_hash}
+        if cached.get('sha256') == content_hash:
+            logger.info("Export content unchanged: {}".format(url))
+            return 'unchanged'
         # prepare to write data to file
         logger.debug("Opening xls file to write data...")
-        with open(full_file_name, 'wb') as handle:
-            response = session_requests.get(url)
-            if not response.ok:
-                logger.info("Writing to xls failed...")
-            for block in response.iter_content(1024):
-                handle.write(block)
-            logger.info("Writing to xls succeeded...")
+        write_output(full_file_name, content)
+        logger.info("Writing to xls succeeded...")
+        return 'changed'
     except Exception as e:
         logger.info("Session download failed with: {}".format(e))
+        return 'failed'
+
+
+def download_and_convert(args, url, full_file_name, session_requests, http_cache=None):
+    """
+    downloads one export and parses its rankings table while the body streams in, run once per position by the
+    download pool
+    :param args: list of parameters can be used to get data directories
+    :param url: string of the export xls url
+    :param full_file_name: string of the full file path and name of file to be saved
+    :param session_requests: logged in session from create_session() shared across the pool
+    :param http_cache: optional dictionary from load_http_cache() shared across the pool
+    :returns: status, rows: string 'changed', 'unchanged' or 'failed' and the parsed table rows (None unless changed)
+    """
+    from lxml import etree
+    logger = logging.getLogger()
+    logger.debug("Starting session download for {}...".format(url))
+    name = os.path.basename(full_file_name)[:-len('-raw.xls')]
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    read_rows, rows = html_row_reader()
+
+    def parse_block(block):
+        # rows are pulled out as each block arrives, the parser never holds the whole table
+        if not read_rows.done:
+            parser.feed(block)
+            read_rows(parser.read_events())
+
+    with stage_span('download', name):
+        status = perform_session_download(args, url, full_file_name, session_requests, http_cache, parse_block)
+    if status != 'changed':
+        return status, None
+    logger.debug("Finishing xls conversion...")
+    with stage_span('parse', name):
+        parser.close()
+        read_rows(parser.read_events())
+        if args.write_csv == "True":
+            write_rows_csv(full_file_name[:-4] + '.csv', rows)
+    return status, rows
+
+
+def rows_from_html_events(events, csv_file_name=None):
+    """
+    pulls the player rows out of the first table of a FantasyPros export in one pass over the parser events
+    this replaces the round trip through the txt file and convertTxtToCsv()
+    :param events: iterable of (event, element) from an lxml pull parser with start and end events
+    :param csv_file_name: optional string of the full file path and name of the csv to write alongside
+    :return: rows: list of lists of the first ten cell strings of each player row
+    """
+    read_rows, rows = html_row_reader()
+    read_rows(events)
+    if csv_file_name is not None:
+        write_rows_csv(csv_file_name, rows)
+    return rows
+
+
+def html_row_reader():
+    """
+    keeps the place in the first table of a FantasyPros export between batches of parser events, so the rows can be
+    read while the export is still downloading, see rows_from_html_events()
+    :returns: read_rows, rows: function taking an iterable of (event, element) from an lxml pull parser with start
+    and end events, its done attribute is set once the table has ended, and the list of lists of the first ten cell
+    strings of each player row read so far
+    """
+    rows = []
+    in_table = False
+    count = 0
+
+    def read_rows(events):
+        nonlocal in_table, count
+        for event, element in events:
+            if read_rows.done:
+                return
+            if element.tag == 'table':
+                if event == 'start' and not in_table:
+                    in_table = True
+                elif event == 'end' and in_table:
+                    read_rows.done = True
+            elif in_table and event == 'end' and element.tag == 'tr':
+                # first row is the heading and second is the tier row, same as convertTxtToCsv()
+                count += 1
+                if count > 2:
+                    nextrow = [''.join(td.itertext()) for td in element.iter('td')]
+                    if len(nextrow) >= 10:
+                        rows.append(nextrow[:10])
+                element.clear()
+
+    read_rows.done = False
+    return read_rows, rows
+
+
+def write_rows_csv(csv_file_name, rows):
+    """
+    writes the parsed rows of an export as a csv, see rows_from_html_events()
+    :param csv_file_name: string of the full file path and name of the csv
+    :param rows: list of lists of cell strings
+    """
+    logger = logging.getLogger()
+    write_output(csv_file_name, ''.join(','.join(row) + '\n' for row in rows).encode('utf-8'))
+    logger.debug("Wrote {} rows to {}...".format(len(rows), csv_file_name))
 
 def convertTxtToCsv(infile, outfile):
+    from bs4 import BeautifulSoup
     file = open(infile, 'r')
     text = file.read()
     soup = BeautifulSoup(text)
@@ -182,65 +636,108 @@ def convertTxtToCsv(infile, outfile):
     return
 
 
-def download_nfl_data(args, week, position_list):
+def nfl_downloads(args, week, position_list):
     """
-    download xls file from fantasy pros to the data_directory specified in args
-    :param args: list of parameters can be used to get data directories
+    builds the list of exports to download for a week, a league profile's position urls replace the defaults
+    :param args: list of parameters can be used to get data directories, the site and the profile's position urls
     :param week: integer week to be used when building file names
     :param position_list: list of positions to download, also used to build file names
+    :return: downloads: list of (url, full file name) tuples
+    """
+    rankings_url = args.fantasypros_url + '/nfl/rankings/'
+    # if preseason
+    if week == 0:
+        preseason_pages = {'preseason-overall': 'consensus-cheatsheets.php?export=xls',
+                           'preseason-qb': 'qb-cheatsheets.php?export=xls',
+                           'preseason-rb': 'rb-cheatsheets.php?export=xls',
+                           'preseason-wr': 'wr-cheatsheets.php?export=xls',
+                           'preseason-te': 'te-cheatsheets.php?export=xls',
+                           'preseason-k': 'k-cheatsheets.php?export=xls',
+                           'preseason-dst': 'dst-cheatsheets.php?export=xls'}
+        pages = [(position, preseason_pages[position]) for position in
+                 ['preseason-overall', 'preseason-qb', 'preseason-rb', 'preseason-wr', 'preseason-te', 'preseason-k',
+                  'preseason-dst']]
+    # if not preseason
+    else:
+        # download each position from the position list
+        pages = [(position, position + '.php?export=xls') for position in position_list]
+        # download ros data
+        # add ros-overall to position list?? What's the url like
+    return [(rankings_url + args.position_urls.get(position, page),
+             os.path.join(args.data_directory, 'week-' + str(week) + '-' + position + '-raw.xls'))
+            for position, page in pages]
+
+
+def completed_downloads(args, downloads, session_requests=None):
+    """
+    downloads and converts exports at the same time over one logged in session, handing each one on as soon as it is
+    done. an url listed more than once, e.g. a position every league profile shares, is only fetched once and its
+    files are copied to the other names
+    :param args: list of parameters can be used to get the data directory for the http cache and the worker count
+    :param downloads: list of (url, full file name) tuples from nfl_downloads()
+    :param session_requests: optional logged in session to reuse, left open for the caller
+    :return: generator of (full file name, status, rows) tuples, one for every file name in downloads
     """
     logger = logging.getLogger()
     try:
         download_data = args.download_data
         if download_data == "True":
-            # get data directory from command line parameters
-            data_directory = args.data_directory
-            # if preseason
-            if week == 0:
-                preseason_rankings = ['https://www.fantasypros.com/nfl/rankings/consensus-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/qb-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/rb-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/wr-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/te-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/k-cheatsheets.php?export=xls',
-                                      'https://www.fantasypros.com/nfl/rankings/dst-cheatsheets.php?export=xls']
-                preseason_rankings_names = ['week-0-preseason-overall-raw.xls',
-                                            'week-0-preseason-qb-raw.xls', 'week-0-preseason-rb-raw.xls',
-                                            'week-0-preseason-wr-raw.xls', 'week-0-preseason-te-raw.xls',
-                                            'week-0-preseason-k-raw.xls', 'week-0-preseason-dst-raw.xls']
-                # download each link separately
-                for item_position in range(len(preseason_rankings)):
-                    # prepare link and path/filename
-                    full_file_name = os.path.join(data_directory, preseason_rankings_names[item_position])
-                    url = preseason_rankings[item_position]
-                    # download using sessions
-                    logger.debug("Starting session download...")
-                    perform_session_download(args, url, full_file_name)
-                    # convert the xls to csv
-                    logger.debug("Starting xls conversion...")
-                    text_from_excel(full_file_name)
-                    convertTxtToCsv(full_file_name[:-4] + '.txt', full_file_name[:-4] + '.csv')
-            # if not preseason
-            else:
-                # download each position from the position list
-                for position in position_list:
-                    # prepare link and path/filename
-                    filename = 'week-' + str(week) + '-' + position + '-raw.xls'
-                    full_file_name = os.path.join(data_directory, filename)
-                    url = 'http://www.fantasypros.com/nfl/rankings/' + position + '.php?export=xls'
-                    # download using sessions
-                    logger.debug("Starting session download...")
-                    perform_session_download(args, url, full_file_name)
-                    # convert the xls to csv
-                    logger.debug("Starting xls conversion...")
-                    text_from_excel(full_file_name)
-                    convertTxtToCsv(full_file_name[:-4] + '.txt', full_file_name[:-4] + '.csv')
-                # download ros data
-                # add ros-overall to position list?? What's the url like
+            unique_downloads = OrderedDict()
+            for url, full_file_name in downloads:
+                unique_downloads.setdefault(url, []).append(full_file_name)
+            # conditional requests use the validators saved by the last run
+            cache_file_name = os.path.join(args.data_directory, 'http-cache.json')
+            http_cache = load_http_cache(cache_file_name) if args.http_cache == "True" else None
+            # log in once then fetch every export concurrently over the same session
+            workers = max(1, min(int(args.download_workers), len(unique_downloads)))
+            own_session = session_requests is None
+            if own_session:
+                session_requests = create_session(args, pool_size=workers)
+            logger.debug("Starting {} session downloads with {} workers...".format(len(unique_downloads), workers))
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = dict((executor.submit(download_and_convert, args, url, full_file_names[0],
+                                                    session_requests, http_cache), full_file_names)
+                                   for url, full_file_names in unique_downloads.items())
+                    for future in as_completed(futures):
+                        full_file_names = futures[future]
+                        status, rows = future.result()
+                        statuses = [status] + [share_download(full_file_names[0], full_file_name, status)
+                                               for full_file_name in full_file_names[1:]]
+                        for full_file_name, file_status in zip(full_file_names, statuses):
+                            yield full_file_name, file_status, rows
+            finally:
+                # keep any cookies the site refreshed for the next run
+                if args.session_file:
+                    save_session_cookies(args, session_requests)
+                if own_session:
+                    session_requests.close()
+            if http_cache is not None:
+                save_http_cache(cache_file_name, http_cache)
     except Exception as e:
         logger.info("Generic download and conversion failed with: {}".format(e))
 
 
+def share_download(source_file_name, full_file_name, status):
+    """
+    copies a download and its csv to the name another league profile expects
+    :param source_file_name: string of the full file path and name the export was downloaded to
+    :param full_file_name: string of the full file path and name to copy to
+    :param status: string download status of the source, see perform_session_download()
+    :return: status: string download status for the copy, 'changed' when a missing copy had to be made
+    """
+    if status == 'failed' or not os.path.exists(source_file_name):
+        return status
+    if status == 'unchanged' and os.path.exists(full_file_name):
+        return status
+    for extension in ['.xls', '.csv']:
+        source = os.path.splitext(source_file_name)[0] + extension
+        if os.path.exists(source):
+            with open(source, 'rb') as source_file:
+                write_output(os.path.splitext(full_file_name)[0] + extension, source_file.read())
+    return 'changed'
+
+
 def get_position_setting(position, settings):
     """
     returns the max number of players to show and the k-value for position
@@ -258,23 +755,36 @@ def get_position_setting(position, settings):
     return max_num, k_val
 
 
-def lists_from_csv(position, week, data_directory):
+def table_from_rows(position, rows):
+    """
+    builds a columnar player table from the table rows to be used in the graphing
+    :param position: string position used to pick the columns
+    :param rows: iterable of lists of cell strings from rows_from_html_events() or a csv reader
+    :return: player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields, vs_adp is nan when missing
+    """
+    records = []
+    # iterate over each row picking out the columns for the table
+    for row in rows:
+        # preseason-overall includes position column, this accounts for it
+        if position == 'preseason-overall' or position == 'flex':
+            vs_adp = float(row[8]) - float(row[0]) if row[8] != '' and row[0] != '' else np.nan
+            records.append((int(row[0]), row[1], row[2], float(row[6]), float(row[7]), vs_adp))
+        # all other positions will use this
+        else:
+            records.append((int(row[0]), row[1], position, float(row[5]), float(row[6]), np.nan))
+    return np.array(records, dtype=PLAYER_TABLE_DTYPE)
+
+
+def table_from_csv(position, week, data_directory):
     """
-    builds lists from the csv to be used in the graphing
+    builds a columnar player table from the csv to be used in the graphing
     :param position: string position used for building csv name
     :param week: integer week used for building csv name
     :param data_directory: string data directory used for building csv name
-    :returns: rank_list, name_list, position_list, average_rank_list, standard_deviation_list, vs_adp_list: lists of data
+    :return: player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields
     """
     logger = logging.getLogger()
     try:
-        # set up empty lists for data storing
-        rank_list = []
-        name_list = []
-        position_list = []
-        average_rank_list = []
-        standard_deviation_list = []
-        vs_adp_list = []
         # build path/filename for csv file
         filename = 'week-' + str(week) + '-' + position + '-raw.csv'
         full_file_name = os.path.join(data_directory, filename)
@@ -283,39 +793,20 @@ def lists_from_csv(position, week, data_directory):
         if verify_file_path(full_file_name):
             # set up csv file to read
             with open(full_file_name, 'r') as csv_file:
-                csv_reader = csv.reader(csv_file)
-                # iterate over each row adding column to appropriate list
-                for row in csv_reader:
-                    rank_list.append(int(row[0]))
-                    name_list.append(str(row[1]))
-                    # preseason-overall includes position column, this accounts for it
-                    if position == 'preseason-overall' or position == 'flex':
-                        position_list.append(str(row[2]))
-                        average_rank_list.append(float(row[6]))
-                        standard_deviation_list.append(float(row[7]))
-                        if row[8] != '' and row[0] != '':
-                            vADP = float(row[8]) - float(row[0])
-                            vs_adp_list.append(vADP)
-                        else: vs_adp_list.append('')
-                    # all other positions will use this
-                    else:
-                        position_list.append(str(position))
-                        average_rank_list.append(float(row[5]))
-                        standard_deviation_list.append(float(row[6]))
-                        vs_adp_list.append('')
-            list_of_lists = [rank_list, name_list, position_list, average_rank_list, standard_deviation_list, vs_adp_list]
-            return list_of_lists
+                return table_from_rows(position, csv.reader(csv_file))
         else:
             logger.info("CSV file not found for: {} - Week {}. Skipping position...".format(position, week))
     except Exception as e:
-        logger.info("Building lists from csv failed with: {}".format(e))
+        logger.info("Building table from csv failed with: {}".format(e))
 
 
-def get_cluster_settings(week):
+def get_cluster_settings(week, overrides=None):
     """
     helper function for getting the parameters needed for plotting
     TODO's: comment, rethink this piece (maybe just return based on position instead of whole list
     :param week: int week used for getting right settings
+    :param overrides: optional dictionary of position to the settings a league profile changes, e.g.
+    {'rb': {'max_num': 50, 'k_val': 10}}
     :returns: type_cluster_settings and ros_settings: list of dictionaries with the appropiate settings
     """
     logger = logging.getLogger()
@@ -339,7 +830,7 @@ def get_cluster_settings(week):
     ros_pos_cluster_settings = [{'pos': 'ros-overall', 'plot1': 60, 'k_val_1': 10, 'plot2': 60, 'k_val_2': 8, 'plot3': 80, 'k_val_3': 8},
                                 {'pos': 'ros-qb', 'max_num': 32, 'k_val': 7},
                                 {'pos': 'ros-rb', 'max_num': 50, 'k_val': 12},
-                                {'pos': 'ros-wr', 'max_num': 64, 'k_val': 65/5},
+                                {'pos': 'ros-wr', 'max_num': 64, 'k_val': 13},
                                 {'pos': 'ros-te', 'max_num': 30, 'k_val': 7},
                                 {'pos': 'ros-k', 'max_num': 20, 'k_val': 5},
                                 {'pos': 'ros-dst', 'max_num': 25, 'k_val': 5}]
@@ -350,16 +841,20 @@ def get_cluster_settings(week):
     else:
         type_cluster_settings = weekly_pos_cluster_settings
         ros_settings = ros_pos_cluster_settings
+    if overrides:
+        type_cluster_settings = [dict(setting, **overrides.get(setting['pos'], {})) for setting in type_cluster_settings]
+        ros_settings = [dict(setting, **overrides.get(setting['pos'], {})) for setting in ros_settings]
     return type_cluster_settings, ros_settings
 
 
-def plot(position, week, args):
+def plot(position, week, args, player_table=None):
     """
     the first stage of the plotting that prepares the data to then be cluster_and_plotted
     TODO's: logging, utilize get_position_settings for preseason data, merge ros/preseason preparation
     :param position: string position used for getting data and position settings for the plotting
     :param week: integer week used for getting data
     :param args: list of parameters can be used to get data and plot directories
+    :param player_table: optional player table built by position_table(), the csv is read when not passed
     """
     logger = logging.getLogger()
     logger.info("Plotting {} for Week {}".format(position.upper(), week))
@@ -368,12 +863,12 @@ def plot(position, week, args):
         "Week {} - {} Tiers - {}".format(week, position.upper(), time.strftime("%Y-%m-%d %H:%M"))
     data_directory = args.data_directory
     # get the cluster settings
-    type_cluster_settings, ros_cluster_settings = get_cluster_settings(week)
+    type_cluster_settings, ros_cluster_settings = get_cluster_settings(week, args.cluster_overrides)
+    if player_table is None:
+        player_table = position_table(args, week, position, {})
     # get preseason settings
     if week == 0:
-        list_of_lists = lists_from_csv(position, week, data_directory)
-        tiers = []
-        # split lists for pos == overall
+        # split table for pos == overall
         if position == 'preseason-overall':
             for dict in type_cluster_settings:
                 if dict.get('pos') == 'preseason-overall':
@@ -382,39 +877,28 @@ def plot(position, week, args):
                     stop2 = start2 + dict.get('plot2')
                     start3 = stop2
                     stop3 = start3 + dict.get('plot3')
-                    sub_plot_1, sub_plot_2, sub_plot_3 = [], [], []
-                    for list in list_of_lists: sub_plot_1.append(list[start1:stop1])
-                    for list in list_of_lists: sub_plot_2.append(list[start2:stop2])
-                    for list in list_of_lists: sub_plot_3.append(list[start3:stop3])
-                    k_value_1, k_value_2, k_value_3 = dict.get('k_val_1'), \
-                                                      dict.get('k_val_2'), \
-                                                      dict.get('k_val_3')
-                    sub_plot_1.append(k_value_1)
-                    sub_plot_2.append(k_value_2)
-                    sub_plot_3.append(k_value_3)
-                    plot_list_of_lists = [sub_plot_1, sub_plot_2, sub_plot_3]
+                    # slices of the table are views so the sub plots do not copy any player data
+                    sub_plots = [(player_table[start1:stop1], auto_k(args, position, week, player_table[start1:stop1], dict.get('k_val_1'))),
+                                 (player_table[start2:stop2], auto_k(args, position, week, player_table[start2:stop2], dict.get('k_val_2'))),
+                                 (player_table[start3:stop3], auto_k(args, position, week, player_table[start3:stop3], dict.get('k_val_3')))]
                     logger.debug("Getting ready to cluster and plot for {}".format(position.upper()))
-                    labels = cluster_and_plot(plot_list_of_lists, plot_filename, title, args)
-                    print(labels)
+                    labels = cluster_and_plot(sub_plots, plot_filename, title, args)
+                    confidence = tier_stability(args, week, position, sub_plots, labels)
                     # create draft sheet
                     unordered_labels = [labels[start1:stop1], labels[start2:stop2], labels[start3:stop3]]
-                    print(unordered_labels)
                     ordered_labels = reorder_labels(unordered_labels)
-                    print(ordered_labels)
-                    # truncate lists for website
-                    web_list_of_lists = []
-                    for list in list_of_lists: web_list_of_lists.append(list[start1:stop3])
-                    web_list_of_lists.append(ordered_labels[start1:stop3])
-                    ffb_draft_sheet(args, web_list_of_lists)
+                    # truncate table for website
+                    if args.web_outputs == "True":
+                        with stage_span('html', 'week-' + str(week) + '-' + position):
+                            ffb_draft_sheet(args, player_table[start1:stop3], ordered_labels[start1:stop3],
+                                            confidence)
         else:
             max_number, k_value = get_position_setting(position, type_cluster_settings)
-            plot_1 = []
-            for list in list_of_lists: plot_1.append(list[0:max_number])
-            plot_1.append(k_value)
-            plot_list_of_lists = [plot_1]
-            cluster_and_plot(plot_list_of_lists, plot_filename, title, args)
+            k_value = auto_k(args, position, week, player_table[0:max_number], k_value)
+            sub_plots = [(player_table[0:max_number], k_value)]
+            labels = cluster_and_plot(sub_plots, plot_filename, title, args)
+            tier_stability(args, week, position, sub_plots, labels)
     else:
-        list_of_lists = lists_from_csv(position, week, data_directory)
         if position == 'ros-overall':
             for dict in type_cluster_settings:
                 if dict.get('pos') == 'ros-overall':
@@ -423,147 +907,1300 @@ def plot(position, week, args):
                     stop2 = start2 + dict.get('plot2')
                     start3 = stop2
                     stop3 = start3 + dict.get('plot3')
-                    sub_plot_1, sub_plot_2, sub_plot_3 = [], [], []
-                    for list in list_of_lists: sub_plot_1.append(list[start1:stop1])
-                    for list in list_of_lists: sub_plot_2.append(list[start2:stop2])
-                    for list in list_of_lists: sub_plot_3.append(list[start3:stop3])
-                    k_value_1, k_value_2, k_value_3 = dict.get('k_val_1'), \
-                                                      dict.get('k_val_2'), \
-                                                      dict.get('k_val_3')
-                    sub_plot_1.append(k_value_1)
-                    sub_plot_2.append(k_value_2)
-                    sub_plot_3.append(k_value_3)
-                    plot_list_of_lists = [sub_plot_1, sub_plot_2, sub_plot_3]
+                    sub_plots = [(player_table[start1:stop1], auto_k(args, position, week, player_table[start1:stop1], dict.get('k_val_1'))),
+                                 (player_table[start2:stop2], auto_k(args, position, week, player_table[start2:stop2], dict.get('k_val_2'))),
+                                 (player_table[start3:stop3], auto_k(args, position, week, player_table[start3:stop3], dict.get('k_val_3')))]
                     logger.debug("Getting ready to cluster and plot for {}".format(position.upper()))
-                    labels = cluster_and_plot(plot_list_of_lists, plot_filename, title, args)
+                    labels = cluster_and_plot(sub_plots, plot_filename, title, args)
+                    confidence = tier_stability(args, week, position, sub_plots, labels)
                     # create draft sheet
                     unordered_labels = [labels[start1:stop1], labels[start2:stop2], labels[start3:stop3]]
                     ordered_labels = reorder_labels(unordered_labels)
-                    # truncate lists for website
-                    web_list_of_lists = []
-                    for list in list_of_lists: web_list_of_lists.append(list[start1:stop3])
-                    web_list_of_lists.append(ordered_labels[start1:stop3])
-                    # ffb_weekly_sheet(args, web_list_of_lists)  # need the data to build this and delete 420/421
+                    # truncate table for website
+                    # ffb_weekly_sheet(args, player_table[start1:stop3], ordered_labels[start1:stop3])  # need the data to build this and delete 420/421
         else:
             max_number, k_value = get_position_setting(position, type_cluster_settings)
-            plot_1 = []
-            for list in list_of_lists: plot_1.append(list[0:max_number])
-            plot_1.append(k_value)
-            plot_list_of_lists = [plot_1]
-            cluster_and_plot(plot_list_of_lists, plot_filename, title, args)
-        web_list_of_lists = [[],[],[],[],[]]
-        ffb_weekly_sheet(args, web_list_of_lists)
+            k_value = auto_k(args, position, week, player_table[0:max_number], k_value)
+            sub_plots = [(player_table[0:max_number], k_value)]
+            labels = cluster_and_plot(sub_plots, plot_filename, title, args)
+            tier_stability(args, week, position, sub_plots, labels)
+
+
+def fit_tiers(average_rank, k_value, algorithm='kmeans', random_state=None, standard_deviation=None):
+    """
+    clusters the average ranks into k tiers with the selected backend
+    :param average_rank: array of the average ranks to cluster
+    :param k_value: integer number of tiers
+    :param algorithm: string 'kmeans' for sklearn KMeans, 'ckmeans' for the exact 1-D dynamic program or 'gmm' for
+    the 1-D Gaussian mixture
+    :param random_state: optional integer seed for KMeans, ckmeans and gmm are deterministic and do not use it
+    :param standard_deviation: optional array of the expert standard deviations, the measurement errors for gmm
+    :returns: labels, centroids: array of the tier of each player and (k, 1) array of the tier centers
+    """
+    if algorithm == 'ckmeans':
+        return ckmeans_1d(average_rank, k_value)
+    if algorithm == 'gmm':
+        if standard_deviation is None:
+            standard_deviation = np.zeros(len(average_rank))
+        return gmm_1d(average_rank, standard_deviation, k_value)[:2]
+    # only the kmeans backend needs sklearn so it is imported here
+    from sklearn.cluster import KMeans
+    # KMeans wants a column vector, reshaping the column is a view not a copy
+    X = np.asarray(average_rank).reshape(-1, 1)
+    # initialize KMeans and fit over the array
+    kmeans = KMeans(n_clusters=int(k_value), random_state=random_state)
+    kmeans.fit(X)
+    return kmeans.labels_, kmeans.cluster_centers_
+
+
+def cached_fit_tiers(args, player_table, k_value, plot_name=None):
+    """
+    fit_position_tiers() memoized on disk so the same ranks, k, backend and seed are only ever clustered once
+    results are kept as .npz files in the data directory, the least recently used are removed past the size limit
+    warm tiers are never cached, a refit_tiers() update is not the fit of those ranks and has to save the plot's state
+    :param args: list of parameters can be used to get the data directory, backend, seed, cache size, the gmm
+    iteration budget and the warm tiers settings
+    :param player_table: numpy structured array of the players to cluster
+    :param k_value: integer number of tiers
+    :param plot_name: optional string name of the plot, e.g. week-0-preseason-qb-raw-1, see fit_position_tiers()
+    :returns: labels, centroids: see fit_tiers()
+    """
+    logger = logging.getLogger()
+    warm = args.cluster_algorithm != 'gmm' and args.warm_tiers == "True" and plot_name is not None
+    if args.tier_cache_mb <= 0 or warm:
+        return fit_position_tiers(args, player_table, k_value, plot_name)
+    average_rank = np.ascontiguousarray(player_table['average_rank'], dtype=np.float64)
+    key_data = average_rank.tobytes()
+    if args.cluster_algorithm == 'gmm':
+        key_data += np.ascontiguousarray(player_table['standard_deviation'], dtype=np.float64).tobytes() + \
+            '|{}'.format(args.gmm_iterations).encode()
+    key = hashlib.sha256('{}|{}|{}|'.format(args.cluster_algorithm, int(k_value), args.cluster_seed).encode()
+                         + key_data).hexdigest()
+    cache_directory = os.path.join(args.data_directory, 'tier-cache')
+    cache_file_name = os.path.join(cache_directory, key[:32] + '.npz')
+    try:
+        with np.load(cache_file_name) as cached:
+            labels, centroids = cached['labels'], cached['centroids']
+        # a hit counts as a use for the eviction order
+        os.utime(cache_file_name)
+        return labels, centroids
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.info("Reading tier cache failed with: {}".format(e))
+    labels, centroids = fit_position_tiers(args, player_table, k_value, plot_name)
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        # render workers share the cache so each writes a file of its own then swaps it in
+        cache_buffer = io.BytesIO()
+        np.savez(cache_buffer, labels=labels, centroids=centroids)
+        write_output(cache_file_name, cache_buffer.getvalue())
+        evict_tier_cache(cache_directory, int(args.tier_cache_mb * 1024 * 1024))
+    except Exception as e:
+        logger.info("Writing tier cache failed with: {}".format(e))
+    return labels, centroids
+
+
+def fit_position_tiers(args, player_table, k_value, plot_name=None):
+    """
+    fit_tiers() with the backend and seed from args, starting from the plot's last fit when there is one
+    a gmm fit starts from the components the last fit saved in the data directory, with warm tiers on a kmeans or
+    ckmeans fit only re-tiers around the players that moved, see warm_fit_tiers()
+    :param args: list of parameters can be used to get the data directory, backend, seed, the gmm iteration budget and
+    the warm tiers settings
+    :param player_table: numpy structured array of the players to cluster
+    :param k_value: integer number of tiers
+    :param plot_name: optional string name of the plot the last fit is saved under
+    :returns: labels, centroids: see fit_tiers()
+    """
+    logger = logging.getLogger()
+    if args.cluster_algorithm != 'gmm':
+        if args.warm_tiers == "True" and plot_name is not None:
+            return warm_fit_tiers(args, player_table, k_value, plot_name)
+        return fit_tiers(player_table['average_rank'], k_value, args.cluster_algorithm, args.cluster_seed)
+    state_file_name = None
+    if plot_name is not None:
+        state_file_name = os.path.join(args.data_directory, 'gmm-state', '{}-k{}.json'.format(plot_name, int(k_value)))
+    init = load_gmm_state(state_file_name) if state_file_name is not None else None
+    labels, centroids, components = gmm_1d(player_table['average_rank'], player_table['standard_deviation'], k_value,
+                                           init, args.gmm_iterations)
+    if components[3] >= args.gmm_iterations:
+        logger.info("Mixture for {} stopped at the {} iteration budget".format(plot_name, args.gmm_iterations))
+    if state_file_name is not None:
+        save_gmm_state(state_file_name, components)
+    return labels, centroids
+
+
+def warm_fit_tiers(args, player_table, k_value, plot_name):
+    """
+    re-tiers a plot from its last fit, saved in the data directory, when only a few players moved
+    nothing moved reuses the last tiers, up to warm_max_moved of the players moved updates the last tiers with
+    refit_tiers() and anything more, or no usable last fit, is a full fit_tiers()
+    :param args: list of parameters can be used to get the data directory, backend, seed and the warm tiers settings
+    :param player_table: numpy structured array of the players to cluster
+    :param k_value: integer number of tiers
+    :param plot_name: string name of the plot the fit is saved under
+    :returns: labels, centroids: see fit_tiers()
+    """
+    logger = logging.getLogger()
+    average_rank = player_table['average_rank']
+    state_file_name = os.path.join(args.data_directory, 'tier-state', '{}-k{}.npz'.format(plot_name, int(k_value)))
+    state = load_tier_state(state_file_name, args.cluster_algorithm)
+    moved = None
+    if state is not None and len(state['names']) == len(player_table):
+        # a player counts as moved if their rank changed or someone else now has their row
+        moved = (state['names'] != player_table['name']) | (state['average_rank'] != average_rank)
+    if moved is None or np.count_nonzero(moved) > args.warm_max_moved * len(player_table):
+        labels, centroids = fit_tiers(average_rank, k_value, args.cluster_algorithm, args.cluster_seed)
+    elif not moved.any():
+        return state['labels'], state['centroids']
+    else:
+        logger.debug("Re-tiering {} around {} moved players".format(plot_name, np.count_nonzero(moved)))
+        labels, centroids = refit_tiers(average_rank, state['labels'], state['centroids'], moved)
+    save_tier_state(state_file_name, args.cluster_algorithm, player_table, labels, centroids)
+    return labels, centroids
+
+
+def refit_tiers(average_rank, labels, centroids, moved, max_iterations=20):
+    """
+    updates a 1-D fit for the players that moved without clustering everyone again
+    the moved players go to the tier whose center is nearest, then only the tiers they left or joined get new centers
+    and only the players of those tiers and the tiers next to them are checked again, repeated until nobody switches
+    :param average_rank: array of the average ranks now
+    :param labels: array of the tier of each player in the last fit
+    :param centroids: (k, 1) array of the tier centers of the last fit
+    :param moved: Boolean array of the players whose rank changed since the last fit
+    :param max_iterations: integer most rounds of re-checking the neighbouring tiers
+    :returns: labels, centroids: array of the tier of each player and (k, 1) array of the tier centers
+    """
+    average_rank = np.asarray(average_rank, dtype=np.float64)
+    labels = np.array(labels, dtype=np.int64)
+    centers = np.array(centroids, dtype=np.float64).reshape(-1)
+    k = len(centers)
+    # the tiers the moved players were in lose or change a member even if the players stay put
+    touched = np.unique(labels[moved])
+    check = np.flatnonzero(moved)
+    for iteration in range(max_iterations):
+        # in 1-D the nearest center is found from the midpoints between the sorted centers
+        order = np.argsort(centers)
+        boundaries = (centers[order][1:] + centers[order][:-1]) / 2
+        new_labels = order[np.searchsorted(boundaries, average_rank[check])]
+        switched = new_labels != labels[check]
+        if iteration > 0 and not switched.any():
+            break
+        touched = np.union1d(touched, np.concatenate((labels[check][switched], new_labels[switched])))
+        labels[check] = new_labels
+        members = np.isin(labels, touched)
+        counts = np.bincount(labels[members], minlength=k)
+        sums = np.bincount(labels[members], average_rank[members], minlength=k)
+        # an empty tier keeps its center
+        updated = touched[counts[touched] > 0]
+        centers[updated] = sums[updated] / counts[updated]
+        # players can only switch across the boundaries of the tiers whose centers moved
+        tier_order = np.empty(k, dtype=np.int64)
+        tier_order[np.argsort(centers)] = np.arange(k)
+        neighbours = np.unique(np.clip(tier_order[touched][:, np.newaxis] + np.array([-1, 0, 1]), 0, k - 1))
+        check = np.flatnonzero(np.isin(tier_order[labels], neighbours))
+        touched = np.zeros(0, dtype=np.int64)
+    return labels, centers[:, np.newaxis]
+
+
+def load_tier_state(state_file_name, algorithm):
+    """
+    loads the last fit of a plot, see warm_fit_tiers()
+    :param state_file_name: string of the full file path and name of the state .npz
+    :param algorithm: string tiering backend, a fit by another backend is not used
+    :return: state: dictionary of names, average_rank, labels and centroids arrays or None if there is no usable fit
+    """
+    logger = logging.getLogger()
+    try:
+        with np.load(state_file_name) as saved:
+            if str(saved['algorithm']) != algorithm:
+                return None
+            return dict((key, saved[key]) for key in ['names', 'average_rank', 'labels', 'centroids'])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.info("Loading tier state failed with: {}".format(e))
+        return None
+
+
+def save_tier_state(state_file_name, algorithm, player_table, labels, centroids):
+    """
+    saves a plot's fit for the next run, see warm_fit_tiers()
+    :param state_file_name: string of the full file path and name of the state .npz
+    :param algorithm: string tiering backend of the fit
+    :param player_table: numpy structured array of the players that were tiered
+    :param labels: array of the tier of each player
+    :param centroids: (k, 1) array of the tier centers
+    """
+    logger = logging.getLogger()
+    try:
+        os.makedirs(os.path.dirname(state_file_name), exist_ok=True)
+        state_buffer = io.BytesIO()
+        np.savez(state_buffer, algorithm=algorithm, names=player_table['name'],
+                 average_rank=player_table['average_rank'], labels=labels, centroids=centroids)
+        write_output(state_file_name, state_buffer.getvalue())
+    except Exception as e:
+        logger.info("Saving tier state failed with: {}".format(e))
+
+
+def evict_tier_cache(cache_directory, max_bytes):
+    """
+    removes the least recently used tier cache files until the cache fits in max_bytes
+    :param cache_directory: string directory of the tier cache
+    :param max_bytes: integer size limit of the cache
+    """
+    entries = []
+    total_bytes = 0
+    with os.scandir(cache_directory) as scan:
+        for entry in scan:
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+    if total_bytes <= max_bytes:
+        return
+    for mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # another worker got to it first
+            pass
+        total_bytes -= size
+        if total_bytes <= max_bytes:
+            break
+
+
+def segment_cost(sum_x, sum_x2, starts, stops):
+    """
+    within segment sum of squares of the sorted values from the prefix sums
+    :param sum_x: array of prefix sums of the sorted values, starting at 0
+    :param sum_x2: array of prefix sums of the squared sorted values, starting at 0
+    :param starts: integer or array of the first index of each segment
+    :param stops: integer or array of the last index (inclusive) of each segment
+    :return: cost: array of the sum of squared distances to the segment means
+    """
+    count = stops + 1 - starts
+    total = sum_x[stops + 1] - sum_x[starts]
+    return sum_x2[stops + 1] - sum_x2[starts] - total * total / count
+
+
+def ckmeans_tables(values, k_max):
+    """
+    fills the exact 1-D k-means (Ckmeans.1d.dp) dynamic program over the sorted values for every k up to k_max
+    the optimal split points never move left as the segment end moves right, so each k is filled in by
+    divide and conquer in O(n log n), O(k n log n) in total, and the result is the same every run
+    :param values: array of the values to cluster
+    :param k_max: integer largest number of clusters, capped at the number of values
+    :returns: order, sum_x, split, sse_by_k: sort order of the values, prefix sums of the sorted values, (k_max, n)
+    array of where cluster m starts when x[0..j] is split into m + 1 clusters and the best total sum of squares for
+    each k from 1 to k_max
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    k_max = max(1, min(int(k_max), n))
+    order = np.argsort(values, kind='mergesort')
+    x = values[order]
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_x2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    # cost[j] is the best cost of clustering x[0..j] into the clusters so far, split[m][j] where cluster m starts
+    cost = segment_cost(sum_x, sum_x2, 0, np.arange(n))
+    split = np.zeros((k_max, n), dtype=np.int64)
+    sse_by_k = np.empty(k_max)
+    sse_by_k[0] = cost[n - 1]
+
+    def fill(previous, current, m, lo, hi, opt_lo, opt_hi):
+        # fill current[lo..hi] knowing their best split lies in [opt_lo, opt_hi]
+        stack = [(lo, hi, opt_lo, opt_hi)]
+        while stack:
+            lo, hi, opt_lo, opt_hi = stack.pop()
+            if lo > hi:
+                continue
+            mid = (lo + hi) // 2
+            starts = np.arange(max(opt_lo, m), min(mid, opt_hi) + 1)
+            candidates = previous[starts - 1] + segment_cost(sum_x, sum_x2, starts, mid)
+            best = int(np.argmin(candidates))
+            current[mid] = candidates[best]
+            split[m][mid] = starts[best]
+            stack.append((lo, mid - 1, opt_lo, starts[best]))
+            stack.append((mid + 1, hi, starts[best], opt_hi))
+
+    for m in range(1, k_max):
+        current = np.full(n, np.inf)
+        fill(cost, current, m, m, n - 1, m, n - 1)
+        cost = current
+        sse_by_k[m] = cost[n - 1]
+    return order, sum_x, split, sse_by_k
+
+
+def ckmeans_labels(order, sum_x, split, k_value):
+    """
+    walks the splits of ckmeans_tables() back from the last value to label the values for one k
+    :param order: array sort order of the values
+    :param sum_x: array of prefix sums of the sorted values, starting at 0
+    :param split: array of cluster starts from ckmeans_tables()
+    :param k_value: integer number of clusters, at most the k_max the tables were filled for
+    :returns: labels, centroids: array of the cluster of each value, numbered 0 for the lowest values up, and
+    (k, 1) array of the cluster means
+    """
+    n = len(order)
+    k = max(1, min(int(k_value), len(split)))
+    sorted_labels = np.empty(n, dtype=np.int64)
+    centroids = np.empty((k, 1))
+    stop = n - 1
+    for m in range(k - 1, -1, -1):
+        start = split[m][stop]
+        sorted_labels[start:stop + 1] = m
+        centroids[m, 0] = (sum_x[stop + 1] - sum_x[start]) / (stop + 1 - start)
+        stop = start - 1
+    labels = np.empty(n, dtype=np.int64)
+    labels[order] = sorted_labels
+    return labels, centroids
+
+
+def ckmeans_1d(values, k_value):
+    """
+    exact 1-D k-means (Ckmeans.1d.dp) by dynamic programming over the sorted values
+    :param values: array of the values to cluster
+    :param k_value: integer number of clusters, capped at the number of values
+    :returns: labels, centroids: array of the cluster of each value, numbered 0 for the lowest values up, and
+    (k, 1) array of the cluster means
+    """
+    order, sum_x, split, sse_by_k = ckmeans_tables(values, k_value)
+    return ckmeans_labels(order, sum_x, split, k_value)
+
+
+def gmm_1d(values, uncertainty, k_value, init=None, max_iterations=100, tolerance=1e-4):
+    """
+    1-D Gaussian mixture fitted by EM where every value has a known measurement error of its own (extreme
+    deconvolution), a player the experts disagree on is wide under every tier so pulls less on where the tiers sit
+    the players are handed out in rank order, each tier taking its share of the mixture's weight, so tiers stay
+    contiguous and every one of the k components gets at least one player even when its argmax would claim none
+    :param values: array of the values to cluster
+    :param uncertainty: array of the standard deviation of each value's measurement
+    :param k_value: integer number of components, capped at the number of values
+    :param init: optional (weights, means, variances) arrays to start from, e.g. the last run's fit, started from k
+    equal runs of the ranks when None, for a different k or when a component of it holds less than one player
+    :param max_iterations: integer most EM iterations, the fit stops there even if it has not converged
+    :param tolerance: float change in mean log likelihood under which the fit has converged
+    :returns: labels, centroids, components: array of the component of each value, numbered 0 for the lowest mean
+    up, (k, 1) array of the component means and (weights, means, variances, iterations) of the fit
+    """
+    values = np.asarray(values, dtype=np.float64)
+    noise = np.square(np.asarray(uncertainty, dtype=np.float64))[:, np.newaxis]
+    k_value = max(1, min(int(k_value), len(values)))
+    if init is not None and len(init[1]) == k_value and np.min(init[0]) * len(values) >= 1:
+        weights, means, variances = (np.array(component, dtype=np.float64) for component in init)
+    else:
+        # start from k runs of equal size along the ranks
+        labels = np.empty(len(values), dtype=np.int64)
+        labels[np.argsort(values, kind='stable')] = np.arange(len(values)) * k_value // len(values)
+        counts = np.bincount(labels, minlength=k_value)
+        means = np.bincount(labels, values, minlength=k_value) / counts
+        variances = np.bincount(labels, np.square(values - means[labels]), minlength=k_value) / counts
+        weights = counts / float(len(values))
+    variances = np.maximum(variances, GMM_MIN_VARIANCE)
+    log_likelihood = -np.inf
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        responsibilities, new_log_likelihood = gmm_responsibilities(values, noise, weights, means, variances)
+        # each value's expected true rank and its variance under each component given its own measurement error
+        gain = variances / (variances + noise)
+        expected = means + gain * (values[:, np.newaxis] - means)
+        expected_variance = variances * (1 - gain)
+        totals = np.maximum(responsibilities.sum(axis=0), np.finfo(np.float64).tiny)
+        weights = totals / len(values)
+        means = (responsibilities * expected).sum(axis=0) / totals
+        variances = np.maximum((responsibilities * (np.square(expected - means) + expected_variance)).sum(axis=0)
+                               / totals, GMM_MIN_VARIANCE)
+        if abs(new_log_likelihood - log_likelihood) < tolerance:
+            break
+        log_likelihood = new_log_likelihood
+    order = np.argsort(means)
+    weights, means, variances = weights[order], means[order], variances[order]
+    # where each tier ends in rank order, at least one player per tier
+    sizes = np.arange(1, k_value + 1)
+    ends = np.round(np.cumsum(weights) * len(values)).astype(np.int64)
+    ends = np.maximum.accumulate(np.clip(ends - sizes, 0, len(values) - k_value)) + sizes
+    ends[-1] = len(values)
+    rank_order = np.argsort(values, kind='stable')
+    labels = np.empty(len(values), dtype=np.int64)
+    labels[rank_order] = np.searchsorted(ends, np.arange(len(values)), side='right')
+    return labels, means[:, np.newaxis], (weights, means, variances, iteration)
+
+
+def gmm_responsibilities(values, noise, weights, means, variances):
+    """
+    the E step of gmm_1d(), how likely each component is to have produced each value
+    :param values: array of the values
+    :param noise: (n, 1) array of the variance of each value's measurement
+    :param weights: array of the component weights
+    :param means: array of the component means
+    :param variances: array of the component variances
+    :returns: responsibilities, log_likelihood: (n, k) array of the component probabilities of each value and float
+    mean log likelihood of the values
+    """
+    total_variance = variances + noise
+    log_densities = np.log(np.maximum(weights, np.finfo(np.float64).tiny)) - 0.5 * (
+        np.log(2 * np.pi * total_variance) + np.square(values[:, np.newaxis] - means) / total_variance)
+    peak = log_densities.max(axis=1, keepdims=True)
+    log_norm = peak + np.log(np.exp(log_densities - peak).sum(axis=1, keepdims=True))
+    return np.exp(log_densities - log_norm), float(log_norm.mean())
+
+
+def load_gmm_state(state_file_name):
+    """
+    loads the components a plot's mixture was last fitted to so the next fit starts from them
+    :param state_file_name: string of the full file path and name of the state json
+    :return: components: (weights, means, variances) lists or None if there is no state
+    """
+    logger = logging.getLogger()
+    if not os.path.isfile(state_file_name):
+        return None
+    try:
+        with open(state_file_name, 'r') as state_file:
+            state = json.load(state_file)
+        return state['weights'], state['means'], state['variances']
+    except Exception as e:
+        logger.info("Loading mixture state failed with: {}".format(e))
+        return None
+
+
+def save_gmm_state(state_file_name, components):
+    """
+    saves the components of a plot's mixture for the next fit, see load_gmm_state()
+    :param state_file_name: string of the full file path and name of the state json
+    :param components: (weights, means, variances, iterations) from gmm_1d()
+    """
+    logger = logging.getLogger()
+    weights, means, variances, iterations = components
+    try:
+        os.makedirs(os.path.dirname(state_file_name), exist_ok=True)
+        write_output(state_file_name, json.dumps(OrderedDict([('weights', weights.tolist()), ('means', means.tolist()),
+                                                              ('variances', variances.tolist()),
+                                                              ('iterations', iterations)]), indent=2))
+    except Exception as e:
+        logger.info("Saving mixture state failed with: {}".format(e))
+
+
+def choose_k(values, k_min, k_max, min_gvf):
+    """
+    picks the number of tiers with the goodness of variance fit (Jenks) elbow criterion, the smallest k whose tiers
+    explain at least min_gvf of the variance
+    one ckmeans_tables() fill gives the best sum of squares of every k so the sweep costs the same as a single fit
+    :param values: array of the values to cluster
+    :param k_min: integer smallest number of tiers to consider
+    :param k_max: integer largest number of tiers to consider
+    :param min_gvf: float share of the variance the tiers have to explain, e.g. 0.99
+    :return: k: integer number of tiers
+    """
+    order, sum_x, split, sse_by_k = ckmeans_tables(values, k_max)
+    k_min = max(1, min(int(k_min), len(sse_by_k)))
+    if sse_by_k[0] <= 0:
+        return k_min
+    gvf = 1 - sse_by_k / sse_by_k[0]
+    good_enough = np.flatnonzero(gvf[k_min - 1:] >= min_gvf)
+    return int(k_min + good_enough[0]) if len(good_enough) else len(sse_by_k)
+
+
+def tier_probabilities(average_rank, standard_deviation, centroids, samples=1000, iterations=10, random_state=None,
+                       tier_sizes=None):
+    """
+    estimates how likely every player is to land in each tier if their average rank was off by their expert spread
+    every sample draws each player's rank from N(average rank, standard deviation) and is re-tiered with 1-D Lloyd
+    iterations started from the fitted tier means, all samples at once as one (samples, players) matrix. with tier
+    sizes the samples are re-tiered the way gmm_1d() hands out its tiers instead, cut in rank order at those sizes
+    :param average_rank: array of the average ranks that were tiered
+    :param standard_deviation: array of the standard deviations of the expert ranks
+    :param centroids: array of the fitted tier means
+    :param samples: integer number of resampled rankings
+    :param iterations: integer most Lloyd iterations, the samples usually settle in a few
+    :param random_state: optional integer seed for the resampling
+    :param tier_sizes: optional array of the number of players in each tier, top tier first
+    :return: probabilities: (players, k) array of the share of samples that put each player in each tier, the tiers in
+    order of their means so column 0 is the top tier
+    """
+    random_state = np.random.RandomState(random_state)
+    average_rank = np.asarray(average_rank, dtype=np.float64)
+    num_players, k = len(average_rank), len(centroids)
+    ranks = average_rank + np.asarray(standard_deviation, dtype=np.float64) * \
+        random_state.standard_normal((samples, num_players))
+    if tier_sizes is not None:
+        # the place of each player in their sample's ranking, then the tier that place falls in
+        places = np.empty((samples, num_players), dtype=np.int64)
+        np.put_along_axis(places, np.argsort(ranks, axis=1, kind='stable'), np.arange(num_players)[np.newaxis, :],
+                          axis=1)
+        labels = np.searchsorted(np.cumsum(tier_sizes), places, side='right')
+        bins = (labels + (np.arange(num_players) * k)[np.newaxis, :]).ravel()
+        return np.bincount(bins, minlength=num_players * k).reshape(num_players, k) / float(samples)
+    means = np.tile(np.sort(np.ravel(centroids)), (samples, 1))
+    # tier t of sample s is bin s * k + t so one bincount sums every tier of every sample
+    offsets = (np.arange(samples) * k)[:, np.newaxis]
+    for iteration in range(iterations + 1):
+        # in 1-D a rank belongs to the tier whose mean is nearest, i.e. how many midpoints between means it is past
+        boundaries = (means[:, 1:] + means[:, :-1]) / 2
+        labels = (ranks[:, :, np.newaxis] > boundaries[:, np.newaxis, :]).sum(axis=2)
+        if iteration == iterations:
+            break
+        bins = (labels + offsets).ravel()
+        counts = np.bincount(bins, minlength=samples * k).reshape(samples, k)
+        sums = np.bincount(bins, ranks.ravel(), minlength=samples * k).reshape(samples, k)
+        # an empty tier keeps its mean
+        new_means = np.sort(np.where(counts > 0, sums / np.maximum(counts, 1), means), axis=1)
+        if np.allclose(new_means, means):
+            break
+        means = new_means
+    bins = (labels + (np.arange(num_players) * k)[np.newaxis, :]).ravel()
+    return np.bincount(bins, minlength=num_players * k).reshape(num_players, k) / float(samples)
+
+
+def tier_stability(args, week, position, sub_plots, labels):
+    """
+    scores how stable every plotted player's tier is, see tier_probabilities(), and saves the scores as json next to
+    the position's data, tiers numbered across the sub plots the same way reorder_labels() numbers them
+    :param args: list of parameters can be used to get the data directory, the number of samples, the seed and the
+    backend
+    :param week: integer week used for the file name
+    :param position: string position used for the file name
+    :param sub_plots: list of (player_table, k_value) tuples that were passed to cluster_and_plot()
+    :param labels: array of the cluster labels cluster_and_plot() returned for the sub plots
+    :return: confidence: array of the probability of each plotted player landing in their own tier, None when off
+    """
+    if args.tier_samples <= 0:
+        return None
+    name = 'week-' + str(week) + '-' + position
+    confidence = []
+    players = []
+    first_tier = 1
+    start = 0
+    with stage_span('stability', name):
+        for player_table, k_value in sub_plots:
+            sub_labels = np.asarray(labels[start:start + len(player_table)])
+            start += len(player_table)
+            average_rank = player_table['average_rank']
+            tier_labels, label_index = np.unique(sub_labels, return_inverse=True)
+            centroids = np.bincount(label_index, average_rank) / np.bincount(label_index)
+            # the fitted labels are arbitrary, rank them by their means to match the probability columns
+            label_tiers = np.empty(len(tier_labels), dtype=np.int64)
+            label_tiers[np.argsort(centroids)] = np.arange(len(tier_labels))
+            tiers = label_tiers[label_index]
+            # gmm tiers are cut by the mixture weights, not the nearest mean, so the samples are cut at the same sizes
+            tier_sizes = np.bincount(tiers) if args.cluster_algorithm == 'gmm' else None
+            probabilities = tier_probabilities(average_rank, player_table['standard_deviation'], centroids,
+                                               args.tier_samples, random_state=args.cluster_seed,
+                                               tier_sizes=tier_sizes)
+            own_tier = probabilities[np.arange(len(tiers)), tiers]
+            confidence.append(own_tier)
+            for n, player_name in enumerate(player_table['name'].tolist()):
+                nonzero = np.flatnonzero(probabilities[n])
+                players.append(OrderedDict([('name', player_name), ('tier', first_tier + int(tiers[n])),
+                                            ('confidence', round(float(own_tier[n]), 3)),
+                                            ('tiers', OrderedDict((str(first_tier + int(tier)),
+                                                                   round(float(probabilities[n, tier]), 3))
+                                                                  for tier in nonzero))]))
+            first_tier += len(tier_labels)
+    write_output(os.path.join(args.data_directory, name + '-tier-stability.json'),
+                 json.dumps(OrderedDict([('samples', args.tier_samples), ('players', players)]), indent=2))
+    return np.concatenate(confidence) if confidence else np.zeros(0)
+
+
+def auto_k(args, position, week, player_table, k_value):
+    """
+    swaps the hand-coded k for one picked by choose_k() for the players being plotted
+    the pick is cached in the data directory by position, week and a hash of the ranks so repeated runs reuse it
+    :param args: list of parameters can be used to get the data directory and the sweep settings
+    :param position: string position used for the cache key
+    :param week: integer week used for the cache key
+    :param player_table: numpy structured array of the players to be tiered
+    :param k_value: integer hand-coded k from get_cluster_settings(), used as is when auto k is off
+    :return: k: integer number of tiers
+    """
+    logger = logging.getLogger()
+    if args.auto_k != "True":
+        return k_value
+    average_rank = np.ascontiguousarray(player_table['average_rank'], dtype=np.float64)
+    key = hashlib.sha256('{}|{}|{}|{}|{}|'.format(position, week, args.min_k, args.max_k, args.min_gvf).encode()
+                         + average_rank.tobytes()).hexdigest()
+    cache_directory = os.path.join(args.data_directory, 'auto-k')
+    cache_file_name = os.path.join(cache_directory, key[:32] + '.json')
+    if verify_file_path(cache_file_name):
+        try:
+            with open(cache_file_name, 'r') as cache_file:
+                return json.load(cache_file)['k']
+        except Exception as e:
+            logger.info("Reading auto k cache failed with: {}".format(e))
+    k = choose_k(average_rank, args.min_k, args.max_k, args.min_gvf)
+    logger.info("Auto k for {} Week {}: {} (hand-coded {})".format(position.upper(), week, k, k_value))
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        write_output(cache_file_name, json.dumps({'position': position, 'week': week, 'k': k}))
+    except Exception as e:
+        logger.info("Writing auto k cache failed with: {}".format(e))
+    return k
+
+
+def save_plot(plots_directory, plot_filename, png_bytes, run_id=None):
+    """
+    output sink that saves the rendered png under its own name
+    :param plots_directory: string directory to save the plot in
+    :param plot_filename: string file name of the plot, e.g. week-0-preseason-qb-raw-1.png
+    :param png_bytes: bytes of the rendered png
+    :param run_id: optional string id of the run to stage the plot for, see write_output()
+    """
+    write_output(os.path.join(plots_directory, plot_filename), png_bytes, run_id)
+
+
+def save_webplot(args, plot_filename, png_bytes):
+    """
+    output sink that saves the rendered png for the website without the week prefix, draft images for preseason
+    and weekly images otherwise
+    :param args: list of parameters can be used to get the draft and weekly directories
+    :param plot_filename: string file name of the plot, e.g. week-0-preseason-qb-raw-1.png
+    :param png_bytes: bytes of the rendered png
+    """
+    webplot_filename_split = plot_filename.split('-')
+    webplot_filename = '-'.join(webplot_filename_split[2:])
+    webplots_directory = args.ffbdraft_directory + "images/" if webplot_filename_split[1] == '0' else args.ffbweekly_directory + "images/"
+    save_plot(webplots_directory, webplot_filename, png_bytes, args.run_id)
 
 
-def cluster_and_plot(list_of_lists, raw_plot_filename, title, args):
+def get_plot_sinks(args):
+    """
+    builds the list of output sinks every rendered plot is handed to
+    sinks are functions taking (plot_filename, png_bytes), add to the list to save plots somewhere else
+    :param args: list of parameters can be used to get the plot directories and if the website charts are written
+    :return: sinks: list of output sink functions
+    """
+    sinks = [partial(save_plot, args.plots_directory, run_id=args.run_id)]
+    if args.web_outputs == "True":
+        sinks.append(partial(save_webplot, args))
+    for plots_directory in args.extra_plots_directories:
+        sinks.append(partial(save_plot, plots_directory, run_id=args.run_id))
+    return sinks
+
+
+def cluster_and_plot(sub_plots, raw_plot_filename, title, args, sinks=None):
     """
     the second stage of the plotting that clusters and plots the data
+    each plot is rendered to png once and the same bytes are handed to every output sink
     TODO's: format graph
-    :param list_of_lists: list of lists that has the pertinent plotting data
-    :param plot_full_file_name: the file name of the plot to be saved
+    :param sub_plots: list of (player_table, k_value) tuples, one for each plot to be saved
+    :param raw_plot_filename: the file name of the plot to be saved
+    :param args: list of parameters can be used to get the plot directories
+    :param sinks: optional list of output sink functions, defaults to get_plot_sinks()
+    :return: labels_copy: array of the cluster labels of every sub plot concatenated
     """
     logger = logging.getLogger()
     logger.debug("Starting cluster and plotting...")
+    if sinks is None:
+        sinks = get_plot_sinks(args)
+    name = raw_plot_filename[:-len('-raw.png')]
 
     list_count = 1  # count for appending to file names (necessary for split plots)
-    # iterate over lists -- needed if plot is split into multiple
-    # logger.debug("Iterating over plot #{} of {} subplot".format(list_count), len(list_of_lists))
-    for list in list_of_lists:
+    # iterate over tables -- needed if plot is split into multiple
+    for player_table, k_value in sub_plots:
         plot_filename = raw_plot_filename[:-4]  # strip .png off file name so adjustments can be made
         # plots to save
         plot_filename += '-{}.png'.format(list_count)
-        plots_directory = args.plots_directory
-        plot_full_file_name = os.path.join(plots_directory, plot_filename)
-        # plots for website
-        webplot_filename_split = plot_filename.split('-')
-        webplot_filename = '-'.join(webplot_filename_split[2:])
-        webplots_directory = args.ffbdraft_directory + "images/" if webplot_filename_split[1] == '0' else args.ffbweekly_directory + "images/"
-        webplot_full_file_name = os.path.join(webplots_directory, webplot_filename)
-        # assign lists
-        rank_list, name_list, position_list, average_rank_list, standard_deviation_list, k_value = list[0], list[1], list[2], list[3], list[4], list[6]
-        # empty list that will be converted into array
-        average_rank_array = []
-        for n in range(len(average_rank_list)):
-            # build list from item and append the list to the list of lists
-            item_list = [average_rank_list[n]]
-            average_rank_array.append(item_list)
-        # convert the list of lists to an array
-        X = np.array(average_rank_array)
-        # initialize KMeans and fit over the array
-        kmeans = KMeans(n_clusters=k_value)
-        kmeans.fit(X)
-        centroids = kmeans.cluster_centers_  # not used here
         # array of labels where a cluster value is assigned to each item
-        labels = kmeans.labels_
+        with stage_span('cluster', name):
+            labels, centroids = cached_fit_tiers(args, player_table, k_value, plot_filename[:-4])
         if list_count == 1:
             labels_copy = labels
         else:
             labels_copy = np.concatenate((labels_copy, labels))
-            print(len(labels_copy))
-        # color list that will automatically generate based on number of clusters
-        colors = []
-        color_cycle = iter(cm.rainbow(np.linspace(0, 5, len(labels))))
-        for i in range(len(labels)):
-            c = next(color_cycle)
-            colors.append(c)
-        # iterate over array and plot values, standard deviation, and color by clusters
-        for i in range(len(X)):
-            plt.errorbar(X[i][0], rank_list[i], xerr=standard_deviation_list[i], marker='.', markersize=4, color=colors[labels[i]], ecolor=colors[labels[i]])
-            position = position_list[i][10:].upper() if len(position_list[i]) > 10 else position_list[i].upper()
-            plt.text(X[i][0] + standard_deviation_list[i] + 1, rank_list[i], "{} {} ({})".format(name_list[i], position, rank_list[i]), size=6, color=colors[labels[i]],
-                     ha="left", va="center")
-        axes = plt.gca()
-        axes.set_axis_bgcolor('#3A3A3A')
-
-        plt.rcParams['savefig.facecolor'] = '#151515'
-        plt.xlim(0,)
-        plt.title(title, color='white')
-        plt.xlabel('Average Ranking', color='white')
-        plt.ylabel('Expert Consensus Ranking', color='white')
-
-        plt.gca().invert_yaxis()  # top-left of graph should start at 1
-        # plt.show()
-        plt.savefig(plot_full_file_name, bbox_inches='tight')  # save the png file
-        plt.savefig(webplot_full_file_name, bbox_inches='tight')  # save the png file
-        plt.clf()  # clear plot after use otherwise subsequent iterations
+        with stage_span('render', name):
+            # color list that will automatically generate based on number of clusters
+            colors = []
+            Figure, FigureCanvasAgg, cm = plotting_modules()
+            color_cycle = iter(cm.rainbow(np.linspace(0, 5, len(labels))))
+            for i in range(len(labels)):
+                c = next(color_cycle)
+                colors.append(c)
+            # a figure of its own on the Agg canvas keeps pyplot's global state out of the render workers
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            axes = figure.add_subplot(111)
+            # plot values, standard deviation, and color by clusters
+            draw_tiers(axes, player_table, labels, colors)
+            axes.set_facecolor('#3A3A3A')
+
+            axes.set_xlim(left=0)
+            axes.set_title(title, color='white')
+            axes.set_xlabel('Average Ranking', color='white')
+            axes.set_ylabel('Expert Consensus Ranking', color='white')
+
+            axes.invert_yaxis()  # top-left of graph should start at 1
+        # render the png once then save the same bytes everywhere
+        with stage_span('savefig', name):
+            png_buffer = io.BytesIO()
+            figure.savefig(png_buffer, format='png', bbox_inches='tight', facecolor='#151515')
+            png_bytes = png_buffer.getvalue()
+            for sink in sinks:
+                sink(plot_filename, png_bytes)
         list_count += 1
     return labels_copy
     # except Exception as e:
     #     logger.info("Clustering and plotting failed with: {}".format(e))
 
 
-def clustering_program(args, start_week_date, position_list):
+@lru_cache(maxsize=None)
+def plotting_modules():
+    """
+    imports matplotlib and applies the ggplot style the first time a process renders a plot
+    :returns: Figure, FigureCanvasAgg, cm: the matplotlib figure and Agg canvas classes and the colormap module
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib import cm
+    from matplotlib import style
+    style.use("ggplot")
+    return Figure, FigureCanvasAgg, cm
+
+
+def draw_tiers(axes, player_table, labels, colors):
+    """
+    draws each tier with a single errorbar call instead of one call per player
+    :param axes: matplotlib axes to draw on
+    :param player_table: numpy structured array of the players to draw
+    :param labels: array of cluster labels matching the player_table rows
+    :param colors: list of colors indexed by cluster label
+    """
+    average_rank, rank = player_table['average_rank'], player_table['rank']
+    standard_deviation = player_table['standard_deviation']
+    # strip the preseason- prefix off positions like preseason-qb for the labels
+    positions = [position[10:].upper() if len(position) > 10 else position.upper() for position in player_table['position']]
+    label_x = average_rank + standard_deviation + 1
+    for tier in np.unique(labels):
+        members = np.flatnonzero(labels == tier)
+        color = colors[tier]
+        # linestyle none so the players of the tier are not joined up
+        axes.errorbar(average_rank[members], rank[members], xerr=standard_deviation[members], linestyle='none',
+                      marker='.', markersize=4, color=color, ecolor=color)
+        for i in members:
+            axes.text(label_x[i], rank[i], "{} {} ({})".format(player_table['name'][i], positions[i], rank[i]),
+                      size=6, color=color, ha="left", va="center")
+
+
+def clustering_program(args, start_week_date, position_list, session_requests=None, executor=None):
     """
     adjusts the position list based on if preseason or not then runs program
+    only positions whose players or settings changed since the last run are clustered and plotted again
+    with league profiles every profile is tiered in the same run, exports they share are downloaded once
     :param args: list of parameters can be used to get data and plot directories
     :param start_week_date: date object for start of season
     :param position_list: list of positions to be used
+    :param session_requests: optional logged in session to download with, see completed_downloads()
+    :param executor: optional process pool to render with, see plot_positions()
+    :returns: download_results: dictionary of full file name to download status, see completed_downloads()
     """
-    # week = get_nfl_week(start_week_date)
-    # if week == 0:
-    #     position_list.remove('flex') & position_list.insert(0, 'overall')
-    #     download_nfl_data(args, week, position_list)
-    #     for pos in position_list:
-    #         preseason_pos = 'preseason-{}'.format(pos)
-    #         plot(preseason_pos, week, args)
-    # else:
-    #     download_nfl_data(args, week, position_list)
-    #     for pos in position_list:
-    #         plot(pos, week, args)
-    logger = logging.getLogger()
     week = get_nfl_week(start_week_date)
-    adjust_position_list = position_list
+    # copy so the caller's list is the same on every scheduled run
+    adjust_position_list = list(position_list)
     if week == 0:
         adjust_position_list.remove('flex')
         adjust_position_list.insert(0, 'overall')
-        download_nfl_data(args, week, position_list)
-        for pos in position_list:
-            preseason_pos = 'preseason-{}'.format(pos)
-            plot(preseason_pos, week, args)
+        plot_positions_list = ['preseason-{}'.format(pos) for pos in adjust_position_list]
+    else:
+        plot_positions_list = adjust_position_list
+    profiles = league_profiles(args)
+    # everything the run writes is staged then put live together
+    run_id = new_run_id()
+    for profile_args in profiles:
+        profile_args.run_id = run_id
+    try:
+        download_results, profile_builds = pipeline_plot_jobs(args, week, profiles, plot_positions_list,
+                                                              session_requests, executor)
+        for profile_args, manifest_file_name, manifest, digests in profile_builds:
+            if week != 0 and digests:
+                with stage_span('html', 'week-' + str(week)):
+                    ffb_weekly_sheet(profile_args, np.zeros(0, dtype=PLAYER_TABLE_DTYPE), [])
+            with stage_span('publish'):
+                publish_outputs(profile_args)
+    except Exception:
+        for profile_args in profiles:
+            discard_outputs(profile_args)
+        raise
+    finally:
+        for profile_args in profiles:
+            profile_args.run_id = None
+    # only recorded once every stale position was plotted so a failed run is retried in full
+    for profile_args, manifest_file_name, manifest, digests in profile_builds:
+        if digests and args.incremental == "True":
+            manifest.update(digests)
+            save_build_manifest(manifest_file_name, manifest)
+    return download_results
+
+
+def pipeline_plot_jobs(args, week, profiles, plot_positions_list, session_requests=None, executor=None):
+    """
+    downloads, converts and plots as a pipeline so a position is clustered and drawn while the next one downloads
+    the stages run at the same time and hand work on through bounded queues, a full queue holds the stage before it
+    back. download threads feed the convert thread which feeds plot jobs to the render workers
+    :param args: list of parameters can be used to get the worker counts and the queue size
+    :param week: integer week used for getting data
+    :param profiles: list of args, one for each league profile, see league_profiles()
+    :param plot_positions_list: list of positions as plot() names them, e.g. preseason-qb
+    :param session_requests: optional logged in session to download with, see completed_downloads()
+    :param executor: optional process pool to render with, see plot_positions()
+    :returns: download_results, profile_builds: dictionary of full file name to download status and list of
+    (profile args, manifest file name, manifest, digests) tuples for the manifests to record once the run is published
+    """
+    logger = logging.getLogger()
+    # every file a position is read from, mapped back to its profile and position
+    file_positions = OrderedDict()
+    profile_builds = []
+    downloads = []
+    for profile_args in profiles:
+        manifest_file_name = os.path.join(profile_args.data_directory, 'build-manifest.json')
+        manifest = load_build_manifest(manifest_file_name) if args.incremental == "True" else {}
+        for pos in plot_positions_list:
+            full_file_name = os.path.join(profile_args.data_directory, 'week-' + str(week) + '-' + pos + '-raw.xls')
+            file_positions[full_file_name] = (len(profile_builds), pos)
+        profile_builds.append((profile_args, manifest_file_name, manifest, {}))
+        downloads.extend(nfl_downloads(profile_args, week, plot_positions_list))
+    download_results = {}
+    convert_queue = queue.Queue(maxsize=args.queue_size)
+    render_queue = queue.Queue(maxsize=args.queue_size)
+    stats = OrderedDict((stage, {'items': 0, 'seconds': 0.0, 'depths': []})
+                        for stage in ['download', 'convert', 'render'])
+    stop = Event()
+    errors = []
+
+    def download_stage():
+        try:
+            if args.download_data == "True":
+                files = completed_downloads(args, downloads, session_requests)
+            else:
+                # nothing to download so every position is converted from its snapshot or csv
+                files = ((full_file_name, None, None) for full_file_name in file_positions)
+            converted = set()
+            for full_file_name, status, rows in files:
+                if status is not None:
+                    download_results[full_file_name] = status
+                converted.add(full_file_name)
+                stats['download']['items'] += 1
+                if not put_bounded(convert_queue, (full_file_name, status, rows), stop, stats['convert']):
+                    return
+            # a position whose download never finished is converted from what the last run saved
+            for full_file_name in file_positions:
+                if full_file_name not in converted:
+                    if not put_bounded(convert_queue, (full_file_name, None, None), stop, stats['convert']):
+                        return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            stats['download']['seconds'] = time.perf_counter() - started
+            put_bounded(convert_queue, None, stop, stats['convert'])
+
+    def convert_stage():
+        try:
+            while True:
+                item = get_bounded(convert_queue, stop)
+                if item is None:
+                    break
+                full_file_name, status, rows = item
+                if full_file_name not in file_positions:
+                    continue
+                stats['convert']['items'] += 1
+                build_index, pos = file_positions[full_file_name]
+                profile_args, manifest_file_name, manifest, digests = profile_builds[build_index]
+                stale_job = stale_plot_job(profile_args, week, pos, {full_file_name: status},
+                                           {full_file_name: rows}, manifest)
+                if stale_job is None:
+                    continue
+                player_table, node, digest = stale_job
+                digests[node] = digest
+                if not put_bounded(render_queue, (profile_args, week, pos, player_table), stop, stats['render']):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            stats['convert']['seconds'] = time.perf_counter() - started
+            put_bounded(render_queue, None, stop, stats['render'])
+
+    workers = max(1, int(args.render_workers))
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    if executor is not None:
+        # start the render workers before the stage threads, forking while threads run is not safe
+        list(executor.map(abs, range(workers)))
+    threads = [Thread(target=download_stage, name='download'), Thread(target=convert_stage, name='convert')]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        rendering = []
+        while True:
+            plot_job = get_bounded(render_queue, stop)
+            if plot_job is None:
+                break
+            job_args, job_week, pos, player_table = plot_job
+            stats['render']['items'] += 1
+            if executor is None:
+                timing_spans.extend(timed_plot(pos, job_week, job_args, player_table))
+                continue
+            rendering.append(executor.submit(timed_plot, pos, job_week, job_args, player_table))
+            # only as many plots in flight as workers so the render queue shows the real backlog
+            if len(rendering) >= workers:
+                timing_spans.extend(rendering.pop(0).result())
+        for future in rendering:
+            timing_spans.extend(future.result())
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        if own_executor:
+            executor.shutdown()
+    if errors:
+        raise errors[0]
+    stats['render']['seconds'] = time.perf_counter() - started
+    queue_stats.clear()
+    for stage, stage_stats in stats.items():
+        depths = stage_stats.pop('depths')
+        # a stage's throughput is over the time until it finished, later stages also wait on the ones before them
+        stage_stats['per_second'] = stage_stats['items'] / stage_stats['seconds'] if stage_stats['seconds'] else 0.0
+        stage_stats['max_queue_depth'] = max(depths) if depths else 0
+        stage_stats['mean_queue_depth'] = sum(depths) / float(len(depths)) if depths else 0.0
+        queue_stats[stage] = stage_stats
+        logger.info("{} stage: {} items in {:.2f}s, {:.2f}/s, input queue depth max {} mean {:.1f}".format(
+            stage.capitalize(), stage_stats['items'], stage_stats['seconds'], stage_stats['per_second'],
+            stage_stats['max_queue_depth'],
+            stage_stats['mean_queue_depth']))
+    return download_results, profile_builds
+
+
+def put_bounded(item_queue, item, stop, stage_stats):
+    """
+    puts an item on a bounded queue, waiting while it is full unless the pipeline is stopped
+    :param item_queue: queue.Queue to put on
+    :param item: item to put, None tells the next stage there is nothing more
+    :param stop: threading.Event set when a stage failed
+    :param stage_stats: dictionary of the next stage's stats, the queue depth after each put is added to its depths
+    :return: Boolean: True if the item was put, False if the pipeline stopped first
+    """
+    while not stop.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            if item is not None:
+                stage_stats['depths'].append(item_queue.qsize())
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get_bounded(item_queue, stop):
+    """
+    gets the next item off a queue, waiting while it is empty unless the pipeline is stopped
+    :param item_queue: queue.Queue to get from
+    :param stop: threading.Event set when a stage failed
+    :return: item: the next item or None when there is nothing more or the pipeline stopped
+    """
+    while not stop.is_set():
+        try:
+            return item_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def league_profiles(args):
+    """
+    builds the args for every league profile in the profiles file, or just args when there is none
+    the profiles file is a json list, each profile has a name and can set its own data_directory, plots_directory,
+    ffbdraft_directory and ffbweekly_directory (defaulting to a folder named after the profile in each), position_urls
+    of position to the FantasyPros export page that replaces the default, and cluster_settings overrides, e.g.
+    [{"name": "ppr", "position_urls": {"rb": "ppr-rb.php?export=xls"}, "cluster_settings": {"rb": {"k_val": 10}}}]
+    a profile's sheets use the templates in its own ffbdraft and ffbweekly folders when there are some, otherwise the
+    default ones, and its charts go to a folder named after it in each of the extra plot directories
+    :param args: list of parameters can be used to get the profiles file and the default directories
+    :return: profiles: list of args, one for each profile
+    """
+    if not args.profiles_file:
+        return [args]
+    with open(args.profiles_file, 'r') as profiles_file:
+        profiles = json.load(profiles_file)
+    all_profile_args = []
+    for profile in profiles:
+        profile_args = argparse.Namespace(**vars(args))
+        for directory in ['data_directory', 'plots_directory', 'ffbdraft_directory', 'ffbweekly_directory']:
+            setattr(profile_args, directory,
+                    profile.get(directory, os.path.join(getattr(args, directory), profile['name'], '')))
+        # a sheet folder without its own templates renders with the ones in the default folder
+        for directory, templates, template_name in [
+                ('ffbdraft_directory', 'ffbdraft_templates', "_tophalf_draft_html.text"),
+                ('ffbweekly_directory', 'ffbweekly_templates', "_tophalf_weekly_html.text")]:
+            if os.path.isfile(os.path.join(getattr(profile_args, directory), template_name)):
+                setattr(profile_args, templates, os.path.join(getattr(profile_args, directory), ''))
+        profile_args.extra_plots_directories = [os.path.join(plots_directory, profile['name'], '')
+                                                for plots_directory in args.extra_plots_directories]
+        for directory in [profile_args.data_directory, profile_args.plots_directory,
+                          os.path.join(profile_args.ffbdraft_directory, 'images'),
+                          os.path.join(profile_args.ffbweekly_directory, 'images')] + \
+                profile_args.extra_plots_directories:
+            os.makedirs(directory, exist_ok=True)
+        profile_args.position_urls = profile.get('position_urls', {})
+        profile_args.cluster_overrides = profile.get('cluster_settings', {})
+        all_profile_args.append(profile_args)
+    return all_profile_args
+
+
+def stale_plot_jobs(args, week, plot_positions_list, download_results, parsed_rows, manifest):
+    """
+    picks out the positions that need to be clustered and plotted again
+    :param args: list of parameters can be used to get data and plot directories
+    :param week: integer week used for getting data
+    :param plot_positions_list: list of positions as plot() names them, e.g. preseason-qb
+    :param download_results: dictionary of full file name to download status from completed_downloads()
+    :param parsed_rows: dictionary of full file name to parsed table rows from completed_downloads()
+    :param manifest: dictionary of node name to the digest its outputs were last built from
+    :returns: plot_jobs, digests: list of (position, player_table) tuples for plot() and dictionary of node name to
+    digest to record once they are plotted
+    """
+    plot_jobs = []
+    digests = {}
+    for pos in plot_positions_list:
+        stale_job = stale_plot_job(args, week, pos, download_results, parsed_rows, manifest)
+        if stale_job is not None:
+            player_table, node, digest = stale_job
+            plot_jobs.append((pos, player_table))
+            digests[node] = digest
+    return plot_jobs, digests
+
+
+def stale_plot_job(args, week, position, download_results, parsed_rows, manifest):
+    """
+    builds the player table for a position if it needs to be clustered and plotted again, see stale_plot_jobs()
+    :param args: list of parameters can be used to get data and plot directories
+    :param week: integer week used for getting data
+    :param position: string position as plot() names it, e.g. preseason-qb
+    :param download_results: dictionary of full file name to download status from completed_downloads()
+    :param parsed_rows: dictionary of full file name to parsed table rows from completed_downloads()
+    :param manifest: dictionary of node name to the digest its outputs were last built from
+    :returns: player_table, node, digest: numpy structured array for plot(), string node name and the digest to record
+    once it is plotted, or None if the position is up to date or has no data
+    """
+    logger = logging.getLogger()
+    # an unchanged export is read back from its snapshot or csv, only the manifest says if its tiers were published
+    player_table = position_table(args, week, position, parsed_rows)
+    if player_table is None:
+        return None
+    node, digest = position_digest(args, week, position, player_table)
+    if manifest.get(node) == digest and verify_file_path(os.path.join(args.plots_directory, node + '-1.png')):
+        if position_unchanged(args, week, position, download_results):
+            logger.info("{} data unchanged for Week {}. Skipping position...".format(position.upper(), week))
+        else:
+            logger.info("{} tiers up to date for Week {}. Skipping position...".format(position.upper(), week))
+        return None
+    return player_table, node, digest
+
+
+def plot_positions(plot_jobs, render_workers, executor=None):
+    """
+    clusters and renders the positions in parallel worker processes, one position per worker
+    :param plot_jobs: list of (args, week, position, player_table) tuples to pass on to plot()
+    :param render_workers: integer most positions to render at the same time
+    :param executor: optional process pool that outlives this call, a pool is made for the call when None
+    """
+    logger = logging.getLogger()
+    workers = max(1, min(int(render_workers), len(plot_jobs)))
+    if workers == 1:
+        for args, week, position, player_table in plot_jobs:
+            timing_spans.extend(timed_plot(position, week, args, player_table))
+        return
+    logger.debug("Rendering {} positions with {} workers...".format(len(plot_jobs), workers))
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            submit_plots(executor, plot_jobs)
     else:
-        download_nfl_data(args, week, position_list)
-        for pos in position_list:
-            plot(pos, week, args)
+        submit_plots(executor, plot_jobs)
+
+
+def submit_plots(executor, plot_jobs):
+    """
+    runs plot() for every job on the executor and waits for all of them
+    :param executor: process pool to submit to
+    :param plot_jobs: list of (args, week, position, player_table) tuples to pass on to plot()
+    """
+    futures = [executor.submit(timed_plot, position, week, args, player_table)
+               for args, week, position, player_table in plot_jobs]
+    # collect in submission order so a failure is raised the same way every run
+    for future in futures:
+        timing_spans.extend(future.result())
+
+
+def timed_plot(position, week, args, player_table):
+    """
+    runs plot() and hands back the timing spans it recorded, render workers send theirs back this way
+    :param position: string position passed on to plot()
+    :param week: integer week passed on to plot()
+    :param args: list of parameters passed on to plot()
+    :param player_table: numpy structured array passed on to plot()
+    :return: spans: list of the timing span dictionaries plot() recorded, see stage_span()
+    """
+    spans = plot_spans.spans = []
+    try:
+        plot(position, week, args, player_table)
+    finally:
+        plot_spans.spans = None
+    return spans
+
+
+def position_unchanged(args, week, position, download_results):
+    """
+    checks if the download for a position came back unchanged
+    an unchanged export is not enough to skip the position, the last run may have failed before publishing its tiers,
+    see stale_plot_job()
+    :param args: list of parameters can be used to get data directories
+    :param week: integer week used for building the xls name
+    :param position: string position used for building the xls name
+    :param download_results: dictionary of full file name to download status from completed_downloads()
+    :return: Boolean: True if the export was not modified since the last run
+    """
+    filename = 'week-' + str(week) + '-' + position + '-raw.xls'
+    full_file_name = os.path.join(args.data_directory, filename)
+    return download_results.get(full_file_name) == 'unchanged'
+
+
+def position_table(args, week, position, parsed_rows):
+    """
+    builds the player table for a position from the rows parsed while it was downloaded, or from its snapshot or csv
+    when the position was not downloaded this run
+    the table is saved as a .npy snapshot once per download so later runs memory-map it instead of parsing text
+    :param args: list of parameters can be used to get data directories and if snapshots are used
+    :param week: integer week used for building the xls name
+    :param position: string position used for building the xls name
+    :param parsed_rows: dictionary of full file name to parsed table rows from completed_downloads()
+    :return: player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields or None if there is no data
+    """
+    with stage_span('convert', 'week-' + str(week) + '-' + position):
+        return build_position_table(args, week, position, parsed_rows)
+
+
+def build_position_table(args, week, position, parsed_rows):
+    """
+    builds the player table for a position, see position_table()
+    :param args: list of parameters can be used to get data directories and if snapshots are used
+    :param week: integer week used for building the file names
+    :param position: string position used for building the file names
+    :param parsed_rows: dictionary of full file name to parsed table rows from completed_downloads()
+    :return: player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields or None if there is no data
+    """
+    filename = 'week-' + str(week) + '-' + position + '-raw.xls'
+    rows = parsed_rows.get(os.path.join(args.data_directory, filename))
+    snapshot_file_name = os.path.join(args.data_directory, 'week-' + str(week) + '-' + position + '-raw.npy')
+    if rows is not None:
+        player_table = table_from_rows(position, rows)
+        if args.snapshots == "True":
+            save_snapshot(snapshot_file_name, player_table)
+        return player_table
+    if args.snapshots == "True":
+        csv_file_name = os.path.join(args.data_directory, 'week-' + str(week) + '-' + position + '-raw.csv')
+        player_table = load_snapshot(snapshot_file_name, csv_file_name)
+        if player_table is not None:
+            return player_table
+    player_table = table_from_csv(position, week, args.data_directory)
+    # csv files from before snapshots, or edited by hand, get one written the first time they are read
+    if player_table is not None and args.snapshots == "True":
+        save_snapshot(snapshot_file_name, player_table)
+    return player_table
+
+
+def save_snapshot(snapshot_file_name, player_table):
+    """
+    saves a player table as a binary .npy snapshot
+    :param snapshot_file_name: string of the full file path and name of the snapshot
+    :param player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields
+    """
+    logger = logging.getLogger()
+    try:
+        # swapped in whole so a reader never maps half a file
+        snapshot_buffer = io.BytesIO()
+        np.save(snapshot_buffer, player_table)
+        write_output(snapshot_file_name, snapshot_buffer.getvalue())
+    except Exception as e:
+        logger.info("Saving snapshot failed with: {}".format(e))
+
+
+def load_snapshot(snapshot_file_name, csv_file_name=None):
+    """
+    memory-maps a player table snapshot read only
+    :param snapshot_file_name: string of the full file path and name of the snapshot
+    :param csv_file_name: optional csv the snapshot was made from, the snapshot is not used if the csv is newer
+    :return: player_table: numpy structured array with the PLAYER_TABLE_DTYPE fields or None if there is no usable
+    snapshot
+    """
+    logger = logging.getLogger()
+    try:
+        snapshot_mtime = os.path.getmtime(snapshot_file_name)
+    except OSError:
+        return None
+    if csv_file_name is not None and os.path.exists(csv_file_name) and os.path.getmtime(csv_file_name) > snapshot_mtime:
+        return None
+    try:
+        player_table = np.load(snapshot_file_name, mmap_mode='r')
+    except Exception as e:
+        logger.info("Loading snapshot failed with: {}".format(e))
+        return None
+    if player_table.dtype != PLAYER_TABLE_DTYPE:
+        return None
+    return player_table
+
+
+def position_digest(args, week, position, player_table):
+    """
+    content address of a position's tiers, a hash of everything that goes into its chart and sheet
+    :param args: list of parameters can be used to get the clustering options
+    :param week: integer week used for the settings and the node name
+    :param position: string position used for the settings and the node name
+    :param player_table: numpy structured array of the position's players
+    :return: node, digest: string name of the position's outputs, e.g. week-0-preseason-qb-raw, and hex digest
+    """
+    type_cluster_settings, ros_cluster_settings = get_cluster_settings(week, args.cluster_overrides)
+    settings = [setting for setting in type_cluster_settings if str(setting.get('pos')).lower() == position.lower()]
+    options = {'settings': settings, 'algorithm': args.cluster_algorithm, 'auto_k': args.auto_k,
+               'min_k': args.min_k, 'max_k': args.max_k, 'min_gvf': args.min_gvf, 'seed': args.cluster_seed,
+               'tier_samples': args.tier_samples, 'gmm_iterations': args.gmm_iterations,
+               'warm_tiers': args.warm_tiers, 'warm_max_moved': args.warm_max_moved}
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode() + player_table.tobytes()).hexdigest()
+    return 'week-' + str(week) + '-' + position + '-raw', digest
+
+
+def load_build_manifest(manifest_file_name):
+    """
+    loads the manifest of the digests each position's outputs were last built from
+    :param manifest_file_name: string of the full file path and name of the manifest json
+    :return: manifest: dictionary of node name to digest, see position_digest()
+    """
+    logger = logging.getLogger()
+    if not verify_file_path(manifest_file_name):
+        return {}
+    try:
+        with open(manifest_file_name, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except Exception as e:
+        logger.info("Loading build manifest failed with: {}".format(e))
+        return {}
+
+
+def save_build_manifest(manifest_file_name, manifest):
+    """
+    saves the manifest of the digests each position's outputs were last built from
+    :param manifest_file_name: string of the full file path and name of the manifest json
+    :param manifest: dictionary of node name to digest, see position_digest()
+    """
+    logger = logging.getLogger()
+    try:
+        write_output(manifest_file_name, json.dumps(manifest, indent=2, sort_keys=True))
+    except Exception as e:
+        logger.info("Saving build manifest failed with: {}".format(e))
 
 
 def reorder_labels(unordered_labels):
@@ -576,131 +2213,288 @@ def reorder_labels(unordered_labels):
     ordered_labels = []
     # for each array go through items
     for array in unordered_labels:
-        print(len(array))
         starting_label += 1
         array_dictionary = {}
         item_values = list(OrderedDict.fromkeys(array))
-        print(item_values)
         for i in range(len(item_values)):
             current_label = starting_label + i
             array_dictionary[item_values[i]] = current_label
-        print(array_dictionary)
         starting_label = current_label
         # for each item in array
         for label in array:
             ordered_labels.append(array_dictionary.get(label))
-    print(len(ordered_labels))
     return ordered_labels
 
 
-def ffb_draft_sheet(args, list_of_lists):
-    """
-    
-    :param args: 
-    :param list_of_lists: 
-    :return: 
-    """
-    tophalf_html = args.ffbdraft_directory + "_tophalf_draft_html.text"
-    bottomhalf_html = args.ffbdraft_directory + "_bottomhalf_draft_html.text"
-    destination_html = args.ffbdraft_directory + "FantasyFootballDraftSheet.html"
-    with open(tophalf_html, 'r') as tophalf_html_file, open(bottomhalf_html, 'r') as bottomhalf_html_file, open(destination_html, 'w') as destination_html_file:
-        # write top half stuff
-        tophalf_html_contents = tophalf_html_file.read()
-        destination_html_file.write(tophalf_html_contents)
-
-        position_images = {'QB': "images/quarterbackbt.png", 'RB': "images/runningbackbt.png", 'WR' : "images/receiverbt.png",
-                           'TE': "images/tightendbt.png", 'DST': "images/defensebt.png", 'K': "images/kickerbt.png"}
-
-        # do other stuff
-        div_start = '\t\t\t\t<div class="col-xs-12 col-lg-2 rowpadsmall"> \n\t\t\t\t\t <ul class="list1"> \n'
-        div_stop = '\t\t\t\t\t </ul> \n\t\t\t </div> \n'
-
-        num_players = len(list_of_lists[0])
-        players_per_column = 35
-        starts = []
-        for e in range(6): starts.append(int(e * players_per_column))
-        stops = []
-        for f in range(6): stops.append(starts[f] + players_per_column)
-        print(list_of_lists)
-        for i in range(6):
-            destination_html_file.write(div_start)
-            rank_list, name_list, position_list, average_rank_list, vs_adp_list, ordered_labels = list_of_lists[0][starts[i]:stops[i]], \
-                                                                                                  list_of_lists[1][starts[i]:stops[i]], \
-                                                                                                  list_of_lists[2][starts[i]:stops[i]], \
-                                                                                                  list_of_lists[3][starts[i]:stops[i]], \
-                                                                                                  list_of_lists[5][starts[i]:stops[i]], \
-                                                                                                  list_of_lists[6][starts[i]:stops[i]]
-            print(name_list)
-            for n in range(len(rank_list)):
-                formatted_ranking = float("{0:.2f}".format(average_rank_list[n]))
-                raw_position = ''.join([i for i in position_list[n] if not i.isdigit()])
-                position_rank = ''.join([i for i in position_list[n] if i.isdigit()])
-                position_image = position_images.get(raw_position)
-                if vs_adp_list[n] == 0:
-                    vs_adp_str = '0'
-                elif vs_adp_list[n] != '':
-                    vs_adp_str = '-' + str(abs(vs_adp_list[n])) if vs_adp_list[n] < 0 else '+' + str(vs_adp_list[n])
-                else:
-                    vs_adp_str = ''
-                print(ordered_labels[n])
-                player_info = '\t\t\t\t\t\t\t\t<li class="listitem1"><img src={} height=20px><small class="grey"> (T{}) {}&nbsp;</small><a style=' \
-                              '"cursor: pointer;"> {}</a><small class="grey"> {}-{} (vADP: {})</small> <a href="#" class="" fp-player-name="{}"></a></li>\n'.format(position_image, ordered_labels[n], formatted_ranking, name_list[n],  raw_position, position_rank, vs_adp_str, name_list[n])
-                destination_html_file.write(player_info)
-            destination_html_file.write(div_stop)
-        # write bottom half
-        bottomhalf_html_contents = bottomhalf_html_file.read()
-        destination_html_file.write(bottomhalf_html_contents)
-
-
-def ffb_weekly_sheet(args, list_of_lists):
-    """
-
-    :param args:
-    :param list_of_lists:
-    :return:
-    """
-    tophalf_html = args.ffbweekly_directory + "_tophalf_weekly_html.text"
-    bottomhalf_html = args.ffbweekly_directory + "_bottomhalf_weekly_html.text"
-    destination_html = args.ffbweekly_directory + "FantasyFootballWeeklySheet.html"
-    with open(tophalf_html, 'r') as tophalf_html_file, open(bottomhalf_html, 'r') as bottomhalf_html_file, open(destination_html, 'w') as destination_html_file:
-        # write top half stuff
-        tophalf_html_contents = tophalf_html_file.read()
-        destination_html_file.write(tophalf_html_contents)
-
-        position_images = {'QB': "images/quarterbackbt.png", 'RB': "images/runningbackbt.png", 'WR' : "images/receiverbt.png",
-                           'TE': "images/tightendbt.png", 'DST': "images/defensebt.png", 'K': "images/kickerbt.png"}
-
-        # do other stuff
-        div_start = '\t\t\t\t<div class="col-xs-12 col-lg-2 rowpadsmall"> \n\t\t\t\t\t <ul class="list1"> \n'
-        div_stop = '\t\t\t\t\t </ul> \n\t\t\t </div> \n'
-
-        num_players = len(list_of_lists[0])
-        players_per_column = 35
-        starts = []
-        for e in range(6): starts.append(int(e * players_per_column))
-        stops = []
-        for f in range(6): stops.append(starts[f] + players_per_column)
-
-        for i in range(6):
-            destination_html_file.write(div_start)
-            rank_list, name_list, position_list, average_rank_list, ordered_labels = list_of_lists[0][starts[i]:stops[i]], \
-                                                                                     list_of_lists[1][starts[i]:stops[i]], \
-                                                                                     list_of_lists[2][starts[i]:stops[i]], \
-                                                                                     list_of_lists[3][starts[i]:stops[i]], \
-                                                                                     list_of_lists[4][starts[i]:stops[i]]
-            print(name_list)
-            for n in range(len(rank_list)):
-                formatted_ranking = float("{0:.2f}".format(average_rank_list[n]))
-                raw_position = ''.join([i for i in position_list[n] if not i.isdigit()])
-                position_rank = ''.join([i for i in position_list[n] if i.isdigit()])
-                position_image = position_images.get(raw_position)
-                player_info = '\t\t\t\t\t\t\t\t<li class="listitem1"><img src={} height=20px><small class="grey"> (T{}) {}&nbsp;</small><a style=' \
-                              '"cursor: pointer;"> {}</a><small class="grey"> {}-{}</small> <a href="#" class="" fp-player-name="{}"></a></li>\n'.format(position_image, ordered_labels[n], formatted_ranking, name_list[n],  raw_position, position_rank, name_list[n])
-                destination_html_file.write(player_info)
-            destination_html_file.write(div_stop)
-        # write bottom half
-        bottomhalf_html_contents = bottomhalf_html_file.read()
-        destination_html_file.write(bottomhalf_html_contents)
+def ffb_draft_sheet(args, player_table, ordered_labels, confidence=None):
+    """
+    writes the draft sheet html with the players and their tiers
+    :param args: list of parameters can be used to get the draft directory and the templates directory
+    :param player_table: numpy structured array of the players to list
+    :param ordered_labels: list of integer tiers from reorder_labels() matching the player_table rows
+    :param confidence: optional array of the chance each player lands in their tier from tier_stability()
+    """
+    html = render_sheet(args.ffbdraft_templates + "_tophalf_draft_html.text",
+                        args.ffbdraft_templates + "_bottomhalf_draft_html.text", DRAFT_PLAYER_HTML, player_table,
+                        ordered_labels, confidence)
+    write_output(args.ffbdraft_directory + "FantasyFootballDraftSheet.html", html, args.run_id)
+
+
+def ffb_weekly_sheet(args, player_table, ordered_labels):
+    """
+    writes the weekly sheet html with the players and their tiers
+    the sheet is optional, without its templates it is skipped so the run's charts still get published
+    :param args: list of parameters can be used to get the weekly directory and the templates directory
+    :param player_table: numpy structured array of the players to list
+    :param ordered_labels: list of integer tiers from reorder_labels() matching the player_table rows
+    """
+    logger = logging.getLogger()
+    tophalf_html = args.ffbweekly_templates + "_tophalf_weekly_html.text"
+    bottomhalf_html = args.ffbweekly_templates + "_bottomhalf_weekly_html.text"
+    if not (os.path.isfile(tophalf_html) and os.path.isfile(bottomhalf_html)):
+        logger.info("No weekly sheet templates in {}. Skipping weekly sheet...".format(args.ffbweekly_templates))
+        return
+    html = render_sheet(tophalf_html, bottomhalf_html, WEEKLY_PLAYER_HTML, player_table, ordered_labels)
+    write_output(args.ffbweekly_directory + "FantasyFootballWeeklySheet.html", html, args.run_id)
+
+
+def render_sheet(tophalf_html, bottomhalf_html, player_html, player_table, ordered_labels, confidence=None,
+                 players_per_column=35, columns=6):
+    """
+    builds a sheet's html in memory, the players go in columns between the top and bottom half templates
+    :param tophalf_html: string file name of the top half template
+    :param bottomhalf_html: string file name of the bottom half template
+    :param player_html: string format template of one player's list item, DRAFT_PLAYER_HTML or WEEKLY_PLAYER_HTML
+    :param player_table: numpy structured array of the players to list
+    :param ordered_labels: list of integer tiers from reorder_labels() matching the player_table rows
+    :param confidence: optional array of the chance each player lands in their tier, shown next to the tier
+    :param players_per_column: integer number of players in each column
+    :param columns: integer number of columns, players past the last column are left off
+    :return: html: string of the whole page
+    """
+    player_table = player_table[:players_per_column * columns]
+    # split every position code like RB12 into RB and 12 at once instead of character by character per player
+    position_codes = player_table['position']
+    raw_positions = np.char.rstrip(position_codes, '0123456789').tolist()
+    position_ranks = np.char.lstrip(position_codes, 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz').tolist()
+    average_ranks = np.round(player_table['average_rank'], 2).tolist()
+    names = player_table['name'].tolist()
+    vs_adps = ['' if vs_adp != vs_adp else '0' if vs_adp == 0 else '{:+}'.format(vs_adp)
+               for vs_adp in player_table['vs_adp'].tolist()]
+    if confidence is None:
+        confidences = [''] * len(names)
+    else:
+        confidences = [' {:.0%}'.format(chance) for chance in confidence[:len(names)].tolist()]
+    format_player = player_html.format
+    parts = [read_template(tophalf_html)]
+    for start in range(0, players_per_column * columns, players_per_column):
+        parts.append(SHEET_COLUMN_START)
+        for n in range(start, min(start + players_per_column, len(names))):
+            parts.append(format_player(image=POSITION_IMAGES.get(raw_positions[n]), tier=ordered_labels[n],
+                                       average_rank=average_ranks[n], name=names[n], position=raw_positions[n],
+                                       position_rank=position_ranks[n], vs_adp=vs_adps[n],
+                                       confidence=confidences[n]))
+        parts.append(SHEET_COLUMN_STOP)
+    parts.append(read_template(bottomhalf_html))
+    return ''.join(parts)
+
+
+def read_template(template_file_name):
+    """
+    reads a sheet template, kept in memory until the file changes
+    :param template_file_name: string of the full file path and name of the template
+    :return: template: string contents of the template
+    """
+    return cached_template(template_file_name, os.path.getmtime(template_file_name))
+
+
+@lru_cache(maxsize=16)
+def cached_template(template_file_name, mtime):
+    """
+    reads a sheet template, see read_template()
+    :param template_file_name: string of the full file path and name of the template
+    :param mtime: float modification time of the file, part of the cache key so edits are picked up
+    :return: template: string contents of the template
+    """
+    with open(template_file_name, 'r') as template_file:
+        return template_file.read()
+
+
+def next_run_time(now, run_times, poll_minutes):
+    """
+    works out when the daemon runs next, either at the next of the daily run times or poll_minutes from now
+    :param now: datetime the last run finished
+    :param run_times: list of 'HH:MM' strings to run at every day, empty to poll on an interval
+    :param poll_minutes: integer minutes between runs when there are no run times
+    :returns: next_run: datetime of the next run
+    """
+    if not run_times:
+        return now + datetime.timedelta(minutes=poll_minutes)
+    upcoming = []
+    for run_time in run_times:
+        hour, minute = [int(part) for part in run_time.split(':')]
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        # a slot that already passed, or was missed by a long run, waits for tomorrow
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+        upcoming.append(next_run)
+    return min(upcoming)
+
+
+def run_time(value):
+    """
+    checks a daemon run time when the arguments are parsed so a typo fails at startup, not after the first run
+    :param value: string time from -at
+    :return: value: the same 'HH:MM' string, see next_run_time()
+    """
+    try:
+        datetime.datetime.strptime(value, '%H:%M')
+    except ValueError:
+        raise argparse.ArgumentTypeError("{!r} is not a HH:MM time".format(value))
+    return value
+
+
+def warm_up(args):
+    """
+    imports the plotting and clustering modules up front so every run, and every render worker forked from this
+    process, starts warm
+    :param args: list of parameters can be used to get the tiering backend
+    """
+    plotting_modules()
+    if args.cluster_algorithm == 'kmeans':
+        import sklearn.cluster
+
+
+def find_raw_csvs(data_directory, first_week, last_week):
+    """
+    finds the raw csv files already downloaded for a range of weeks
+    :param data_directory: string directory to look in
+    :param first_week: integer first week to include, 0 for preseason
+    :param last_week: integer last week to include
+    :return: weeks: ordered dictionary of integer week to list of positions as plot() names them
+    """
+    found = []
+    for file_name in os.listdir(data_directory):
+        match = RAW_CSV_PATTERN.match(file_name)
+        if match and first_week <= int(match.group(1)) <= last_week:
+            found.append((int(match.group(1)), match.group(2)))
+    weeks = OrderedDict()
+    for week, position in sorted(found):
+        weeks.setdefault(week, []).append(position)
+    return weeks
+
+
+def season_args(args, season):
+    """
+    copies args with the data and plot directories pointed at another season, the last folder of each is swapped
+    for the season, e.g. data/fftiers/2017/ becomes data/fftiers/2016/, and the extra plot directories get a folder
+    for the season so seasons never write the same chart
+    :param args: list of parameters can be used to get data and plot directories
+    :param season: integer or string season
+    :return: args: copy of args for the season
+    """
+    args = argparse.Namespace(**vars(args))
+    for directory in ['data_directory', 'plots_directory']:
+        parent_directory = os.path.dirname(os.path.normpath(getattr(args, directory)))
+        setattr(args, directory, os.path.join(parent_directory, str(season), ''))
+    args.extra_plots_directories = [os.path.join(plots_directory, str(season), '')
+                                    for plots_directory in args.extra_plots_directories]
+    for plots_directory in [args.plots_directory] + args.extra_plots_directories:
+        os.makedirs(plots_directory, exist_ok=True)
+    return args
+
+
+def run_batch(args):
+    """
+    re-tiers every week and position already on disk for the seasons and weeks in args in one process
+    the modules are imported once and every chart of every season goes through the same render pool. only the plot
+    directories are written, the website charts and sheets drop the week so a backfill would put old weeks live
+    :param args: list of parameters can be used to get the seasons, weeks and everything plot() needs
+    """
+    logger = logging.getLogger()
+    first_week, last_week = [int(week) for week in args.batch_weeks.split('-')]
+    # every season's outputs are staged under the one run id then put live together
+    args.run_id = new_run_id()
+    args.web_outputs = "False"
+    all_season_args = [season_args(args, season) for season in args.seasons] if args.seasons else [args]
+    warm_up(args)
+    jobs = []
+    manifests = []
+    for one_season_args in all_season_args:
+        manifest_file_name = os.path.join(one_season_args.data_directory, 'build-manifest.json')
+        manifest = load_build_manifest(manifest_file_name) if args.incremental == "True" else {}
+        digests = {}
+        for week, positions in find_raw_csvs(one_season_args.data_directory, first_week, last_week).items():
+            # only positions with cluster settings can be plotted, e.g. skips a downloaded ros file mid season
+            type_cluster_settings, ros_cluster_settings = get_cluster_settings(week, one_season_args.cluster_overrides)
+            known_positions = [str(setting.get('pos')) for setting in type_cluster_settings]
+            plot_jobs, week_digests = stale_plot_jobs(one_season_args, week,
+                                                      [pos for pos in positions if pos in known_positions], {}, {},
+                                                      manifest)
+            jobs.extend((one_season_args, week, pos, player_table) for pos, player_table in plot_jobs)
+            digests.update(week_digests)
+        manifests.append((manifest_file_name, manifest, digests))
+    logger.info("Batch re-tiering {} charts...".format(len(jobs)))
+    try:
+        plot_positions(jobs, args.render_workers)
+        for one_season_args in all_season_args:
+            with stage_span('publish'):
+                publish_outputs(one_season_args)
+    except Exception:
+        for one_season_args in all_season_args:
+            discard_outputs(one_season_args)
+        raise
+    finally:
+        args.run_id = None
+        args.web_outputs = "True"
+    if args.incremental == "True":
+        for manifest_file_name, manifest, digests in manifests:
+            if digests:
+                manifest.update(digests)
+                save_build_manifest(manifest_file_name, manifest)
+
+
+def run_daemon(args, start_week_date, position_list):
+    """
+    runs the program on the schedule from args until interrupted
+    one run at a time in this process, a run that goes long pushes the next one to the following slot instead of
+    overlapping it. the logged in session, the render pool and the heavy modules are kept between runs and the http
+    cache means a run only re-tiers the positions that changed
+    :param args: list of parameters can be used to get the schedule and everything clustering_program() needs
+    :param start_week_date: date object for start of season
+    :param position_list: list of positions to be used
+    """
+    logger = logging.getLogger()
+    warm_up(args)
+    session_requests = None
+    executor = ProcessPoolExecutor(max_workers=args.render_workers) if args.render_workers > 1 else None
+    try:
+        while True:
+            logger.info("Scheduled run started")
+            started = datetime.datetime.now()
+            try:
+                if session_requests is None and args.download_data == "True":
+                    session_requests = create_session(args, pool_size=args.download_workers)
+                download_results = clustering_program(args, start_week_date, position_list, session_requests, executor)
+                # nothing came back at all, most likely the login expired so log in again next run
+                if download_results and all(status == 'failed' for status in download_results.values()):
+                    session_requests.close()
+                    session_requests = None
+            except Exception as e:
+                logger.critical("Scheduled run failed with: {}".format(e))
+                logger.critical(traceback.format_exc().replace("\n", " | "))
+                if session_requests is not None:
+                    session_requests.close()
+                    session_requests = None
+            write_run_report(args, started)
+            next_run = next_run_time(datetime.datetime.now(), args.run_times, args.poll_minutes)
+            logger.info("Next run at {}".format(next_run.strftime("%Y-%m-%d %H:%M")))
+            time.sleep(max(0.0, (next_run - datetime.datetime.now()).total_seconds()))
+    finally:
+        if session_requests is not None:
+            session_requests.close()
+        if executor is not None:
+            executor.shutdown()
 
 
 def main(args):
@@ -709,19 +2503,92 @@ def main(args):
     position_list = ['qb', 'rb', 'wr', 'te', 'flex', 'k', 'dst']
     start_week_date = datetime.date(2017, 9, 1)
     injured_player_list = []
-    clustering_program(args, start_week_date, position_list)
+    # set for the length of each run, see write_output()
+    args.run_id = None
+    # a league profile swaps these, see league_profiles()
+    args.position_urls = {}
+    args.cluster_overrides = {}
+    # a batch run turns this off, see run_batch()
+    args.web_outputs = "True"
+    args.ffbdraft_templates = args.ffbdraft_directory
+    args.ffbweekly_templates = args.ffbweekly_directory
+    started = datetime.datetime.now()
+    run_profiled(args, run_mode, args, start_week_date, position_list)
+    write_run_report(args, started)
+
+
+def run_mode(args, start_week_date, position_list):
+    """
+    runs the program once, as a batch or as a daemon depending on args
+    :param args: list of parameters can be used to get the mode
+    :param start_week_date: date object for start of season
+    :param position_list: list of positions to be used
+    """
+    if args.batch == "True":
+        run_batch(args)
+    elif args.daemon == "True":
+        run_daemon(args, start_week_date, position_list)
+    else:
+        clustering_program(args, start_week_date, position_list)
+
 
-    # # start loop
-    # while True:
-    #     # get timer components
-    #     x = datetime.datetime.now()
-    #     y = x.replace(day=x.day + 1, hour=23, minute=40, second=0, microsecond=0)
-    #     delta_t = y - x
-    #     secs = delta_t.seconds + 1
-    #     print(secs)
-    #     # after secs is up run the program
-    #     t = Timer(secs, clustering_program(args, start_week_date, position_list))
-    #     t.start()
+def run_profiled(args, function, *function_args):
+    """
+    calls function under the profiler picked in args, render workers are not profiled so use -rw 1 to see rendering
+    :param args: list of parameters can be used to get the profiler and the file to save its output to
+    :param function: function to call
+    :param function_args: arguments to call function with
+    """
+    logger = logging.getLogger()
+    if args.profiler == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            function(*function_args)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile_file + '.prof')
+            logger.info("Saved cProfile stats to {}.prof".format(args.profile_file))
+    elif args.profiler == 'pyinstrument':
+        # optional, only needed when asked for
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            function(*function_args)
+        finally:
+            profiler.stop()
+            write_output(args.profile_file + '.html', profiler.output_html())
+            logger.info("Saved pyinstrument report to {}.html".format(args.profile_file))
+    else:
+        function(*function_args)
+
+
+def write_run_report(args, started):
+    """
+    logs where the run's time went by stage and saves the timing spans and pipeline queue stats as a json report if
+    asked for. the spans are cleared so the next scheduled run starts its own report
+    :param args: list of parameters can be used to get the report file
+    :param started: datetime the run started
+    """
+    logger = logging.getLogger()
+    stages = OrderedDict()
+    names = OrderedDict()
+    for span in timing_spans:
+        stages[span['stage']] = stages.get(span['stage'], 0.0) + span['seconds']
+        if span['name'] is not None:
+            names.setdefault(span['name'], OrderedDict())
+            names[span['name']][span['stage']] = names[span['name']].get(span['stage'], 0.0) + span['seconds']
+    seconds = (datetime.datetime.now() - started).total_seconds()
+    logger.info("Run took {:.2f}s: {}".format(seconds, ', '.join('{} {:.2f}s'.format(stage, stage_seconds)
+                                                                  for stage, stage_seconds in stages.items())))
+    if args.report_file:
+        report = OrderedDict([('started', started.isoformat()), ('seconds', seconds), ('stages', stages),
+                              ('queues', queue_stats), ('names', names), ('spans', timing_spans)])
+        write_output(args.report_file, json.dumps(report, indent=2))
+    del timing_spans[:]
+    queue_stats.clear()
 
 
 if __name__ == "__main__":    # get all of the commandline arguments
@@ -729,13 +2596,49 @@ if __name__ == "__main__":    # get all of the commandline arguments
     # required parameters
     parser.add_argument('-u', dest='username', help="FantasyPros username", required=True)
     parser.add_argument('-p', dest='password', help="FantasyPros password", required=True)
-    parser.add_argument('-t', dest='token', help="FantasyPros token", required=True)
     # optional parameters
+    parser.add_argument('-t', dest='token', help="FantasyPros token, only used if the login page has none", default=None)
     parser.add_argument('-down', dest='download_data', help="Boolean for if script should download data", default="True")
     parser.add_argument('-dat', dest='data_directory', help="The directory where the data is downloaded", default="data/fftiers/2017/")
     parser.add_argument('-plot', dest='plots_directory', help="The directory where the plots are saved", default="plots/fftiers/2017/")
     parser.add_argument('-draft', dest='ffbdraft_directory', help="The directory where the draft html is saved", default="ffbdraft/")
     parser.add_argument('-weekly', dest='ffbweekly_directory', help="The directory where the weekly html is saved", default="ffbweekly/")
+    parser.add_argument('-sinks', dest='extra_plots_directories', help="Extra directories every plot is also saved to", nargs='*', default=[])
+    parser.add_argument('-login', dest='login_url', help="The FantasyPros login url", default="https://secure.fantasypros.com/accounts/login/?")
+    parser.add_argument('-fp', dest='fantasypros_url', help="The FantasyPros site the exports are downloaded from", default="https://www.fantasypros.com")
+    parser.add_argument('-snap', dest='snapshots', help="Boolean for if parsed rankings are kept as memory-mapped binary snapshots", default="True")
+    parser.add_argument('-csv', dest='write_csv', help="Boolean for if parsed rankings should also be saved as csv", default="True")
+    parser.add_argument('-algo', dest='cluster_algorithm', help="The tiering backend, kmeans, the exact 1-D ckmeans or gmm, a 1-D Gaussian mixture weighted by each player's standard deviation",
+                        choices=['kmeans', 'ckmeans', 'gmm'], default="kmeans")
+    parser.add_argument('-gmmIter', dest='gmm_iterations', help="The most EM iterations a gmm fit may take", default=100, type=int)
+    parser.add_argument('-warm', dest='warm_tiers', help="Boolean for if kmeans and ckmeans tiers are updated from the last run when only a few players moved", default="False")
+    parser.add_argument('-warmMax', dest='warm_max_moved', help="The share of players that can move before warm tiers fall back to a full fit", default=0.1, type=float)
+    parser.add_argument('-seed', dest='cluster_seed', help="Optional seed for kmeans so reruns give the same tiers", default=None, type=int)
+    parser.add_argument('-tcache', dest='tier_cache_mb', help="The size limit in MB of the on-disk tier cache, 0 turns it off", default=64, type=float)
+    parser.add_argument('-samples', dest='tier_samples', help="The resampled rankings each tier's stability is scored on, 0 turns it off", default=1000, type=int)
+    parser.add_argument('-autok', dest='auto_k', help="Boolean for if the number of tiers should be picked from the data", default="False")
+    parser.add_argument('-kmin', dest='min_k', help="The fewest tiers auto k will pick", default=2, type=int)
+    parser.add_argument('-kmax', dest='max_k', help="The most tiers auto k will pick", default=20, type=int)
+    parser.add_argument('-gvf', dest='min_gvf', help="The share of rank variance the auto k tiers have to explain", default=0.99, type=float)
+    parser.add_argument('-rw', dest='render_workers', help="The number of positions to render at the same time", default=os.cpu_count() or 1, type=int)
+    parser.add_argument('-session', dest='session_file', help="The file the logged in session is kept in between runs, empty to log in every run",
+                        default=os.path.join(os.path.expanduser('~'), '.fftiers-session.json'))
+    parser.add_argument('-cache', dest='http_cache', help="Boolean for if downloads should use conditional requests", default="True")
+    parser.add_argument('-dlw', dest='download_workers', help="The number of exports to download at the same time", default=7, type=int)
+    parser.add_argument('-queue', dest='queue_size', help="The most positions waiting between the download, convert and render stages", default=4, type=int)
+    parser.add_argument('-imageDays', dest='image_max_days', help="The days a website chart no page links any more is kept for", default=7, type=float)
+    parser.add_argument('-incr', dest='incremental', help="Boolean for if positions that have not changed since the last run are skipped", default="True")
+    parser.add_argument('-profiles', dest='profiles_file', help="Optional json file of league profiles to tier in the same run", default=None)
+    parser.add_argument('-batch', dest='batch', help="Boolean for if every week already downloaded should be re-tiered instead", default="False")
+    parser.add_argument('-weeks', dest='batch_weeks', help="The first-last range of weeks the batch mode re-tiers", default="0-17")
+    parser.add_argument('-seasons', dest='seasons', help="Seasons the batch mode re-tiers, swapped in for the last folder of -dat and -plot", nargs='*', default=[])
+    parser.add_argument('-daemon', dest='daemon', help="Boolean for if the program should keep running on a schedule", default="False")
+    parser.add_argument('-every', dest='poll_minutes', help="The minutes between daemon runs", default=60, type=int)
+    parser.add_argument('-at', dest='run_times', help="Daily HH:MM times for daemon runs, used instead of -every", nargs='*', default=[], type=run_time)
+    parser.add_argument('-report', dest='report_file', help="Optional json file to save the run's per stage timings to", default=None)
+    parser.add_argument('-profile', dest='profiler', help="Profile the run with cProfile or pyinstrument",
+                        choices=['none', 'cprofile', 'pyinstrument'], default="none")
+    parser.add_argument('-profileFile', dest='profile_file', help="The file the profile is saved to, .prof or .html is added", default="ff-tiers-profile")
     # required for logging
     parser.add_argument('-logFile', dest='logFile', help='The log file to use', default="log.txt")
     args = parser.parse_args()